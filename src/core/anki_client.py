@@ -1,10 +1,14 @@
 from __future__ import annotations
 
+import atexit
+import functools
 import json
 import logging
 from typing import Any, Dict, List, Optional, TypedDict # TypedDictを追加
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from ..utils import config
 from .gemini_client import ProcessedItem, ProcessedWord, ProcessedSentence # Import ProcessedItem and its sub-types
@@ -12,6 +16,14 @@ from .gemini_client import ProcessedItem, ProcessedWord, ProcessedSentence # Imp
 
 logger = logging.getLogger(__name__)
 
+# AnkiConnect への接続を使い回すための共有セッション
+# Retry は POST を再送しないため、再試行されるのは接続確立の失敗（Anki の起動待ちなど）だけ
+_session = requests.Session()
+_session.mount(
+    "http://",
+    HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=Retry(total=3, backoff_factor=0.2)),
+)
+
 # TypedDict for Anki Note Fields
 class AnkiFields(TypedDict):
     単語: str
@@ -33,20 +45,43 @@ class AnkiNote(TypedDict):
     options: Dict[str, Any]
 
 
+# Note settings are fixed for the lifetime of the process, so resolve them once instead of per note.
+_WORD_DECK: str = config.ANKI_WORD_DECK_NAME
+_WORD_MODEL: str = config.ANKI_WORD_NOTE_TYPE
+_SENTENCE_DECK: str = config.ANKI_SENTENCE_DECK_NAME
+_SENTENCE_MODEL: str = config.ANKI_SENTENCE_NOTE_TYPE
+_NOTE_OPTIONS: Dict[str, Any] = {"allowDuplicate": True}  # Shared by every note; treat as read-only
+# AnkiConnect's error message when a note or card targets a missing deck
+_DECK_NOT_FOUND = "deck was not found"
+
+
 def _invoke(action: str, params: Optional[Dict[str, Any]] = None) -> Any:
     payload = {"action": action, "version": 6}
     if params:
         payload["params"] = params
-    resp = requests.post(config.ANKICONNECT_URL, json=payload, timeout=30)
+    resp = _session.post(config.ANKICONNECT_URL, json=payload, timeout=30)
     resp.raise_for_status()
     data = resp.json()
     if data.get("error"):
         # エラーメッセージをより詳細にする
         error_message = data["error"]
         logger.error("AnkiConnect error for action '%s': %s", action, error_message)
+        if _DECK_NOT_FOUND in str(error_message):
+            # A deck was deleted while the process was running; let ensure_deck_and_model create it again
+            ensure_deck_and_model.cache_clear()
         raise RuntimeError(f"AnkiConnect error: {error_message}")
     return data.get("result")
-    
+
+
+def close_session() -> None:
+    """Closes the pooled AnkiConnect connections."""
+    _session.close()
+
+
+# Scripts that never call close_session still release the pooled connections on exit
+atexit.register(close_session)
+
+
 def check_connection() -> bool:
     """Checks if AnkiConnect is accessible."""
     try:
@@ -56,7 +91,9 @@ def check_connection() -> bool:
         return False
 
 
+@functools.lru_cache(maxsize=None)
 def ensure_deck_and_model(deck_name: str, model_name: str) -> None:
+    # Memoized: the deck only needs creating once per process (failed calls raise and are not cached)
     _invoke("createDeck", {"deck": deck_name})
     # Model creation is not attempted here; assume existing model
 
@@ -67,8 +104,8 @@ def format_word_note(word_data: ProcessedWord) -> AnkiNote: # 型ヒントを更
     Assumes a note type with 'Front', 'Back', 'ExampleSentence', 'ExampleSentenceTranslation' fields.
     """
     return {
-        "deckName": config.ANKI_WORD_DECK_NAME,
-        "modelName": config.ANKI_WORD_NOTE_TYPE,
+        "deckName": _WORD_DECK,
+        "modelName": _WORD_MODEL,
         "fields": {
             "単語": word_data.english_word,
             "フレーズ": word_data.example_sentence,
@@ -77,7 +114,7 @@ def format_word_note(word_data: ProcessedWord) -> AnkiNote: # 型ヒントを更
             "単語音声": "",
             "フレーズ音声": "",
         },
-        "options": {"allowDuplicate": True},
+        "options": _NOTE_OPTIONS,
     }
 
 def format_sentence_note(sentence_data: ProcessedSentence) -> AnkiNote: # 型ヒントを更新
@@ -86,13 +123,13 @@ def format_sentence_note(sentence_data: ProcessedSentence) -> AnkiNote: # 型ヒ
     Assumes a note type with 'Front' and 'Back' fields (e.g., for English sentence on front, Japanese on back).
     """
     return {
-        "deckName": config.ANKI_SENTENCE_DECK_NAME,
-        "modelName": config.ANKI_SENTENCE_NOTE_TYPE,
+        "deckName": _SENTENCE_DECK,
+        "modelName": _SENTENCE_MODEL,
         "fields": {
             "Front": sentence_data.japanese_sentence,
             "Back": sentence_data.english_sentence,
         },
-        "options": {"allowDuplicate": True},
+        "options": _NOTE_OPTIONS,
     }
 
 def add_note(note: AnkiNote) -> Optional[int]: # 型ヒントを更新
@@ -114,6 +151,59 @@ def add_note(note: AnkiNote) -> Optional[int]: # 型ヒントを更新
         return None
 
 
+def can_add_notes(notes: List[AnkiNote]) -> List[bool]:
+    """
+    Checks in a single request which notes AnkiConnect would accept.
+    If the check itself fails, every note is reported as addable and left for addNotes to decide.
+    """
+    if not notes:
+        return []
+    try:
+        result = _invoke("canAddNotesWithErrorDetail", {"notes": notes})
+    except Exception as e:
+        logger.warning("Failed to pre-validate notes with AnkiConnect: %s", e)
+        return [True] * len(notes)
+    if not isinstance(result, list) or len(result) != len(notes) or not all(isinstance(r, dict) for r in result):
+        logger.warning("Unexpected canAddNotesWithErrorDetail result from AnkiConnect: %s", result)
+        return [True] * len(notes)
+    errors = [str(r.get("error") or "") for r in result if not r.get("canAdd")]
+    if errors:
+        logger.debug("AnkiConnect rejected %d notes: %s", len(errors), errors)
+    if any(_DECK_NOT_FOUND in error for error in errors):
+        # A missing deck is reported per note rather than as an error from _invoke, so forget the memoized decks here too
+        ensure_deck_and_model.cache_clear()
+    return [bool(r.get("canAdd")) for r in result]
+
+
+def add_notes(notes: List[AnkiNote]) -> List[Optional[int]]:
+    """
+    Adds multiple Anki notes in a single AnkiConnect request.
+    Returns a list of note IDs aligned with the input, with None for each note that failed.
+    """
+    if not notes:
+        return []
+    logger.info("Attempting to add %d notes to AnkiConnect in one request.", len(notes))
+    # addNotes cannot be used here: recent AnkiConnect versions answer it with one aggregated error when any note
+    # fails, hiding the IDs of the notes that were added. multi reports each addNote's result or error separately.
+    actions = [{"action": "addNote", "version": 6, "params": {"note": note}} for note in notes]
+    try:
+        result = _invoke("multi", {"actions": actions})
+    except Exception as e:
+        logger.error("Failed to add notes to AnkiConnect: %s", e)
+        return [None] * len(notes)
+    if not isinstance(result, list) or len(result) != len(notes):
+        logger.error("Unexpected multi result from AnkiConnect: %s", result)
+        return [None] * len(notes)
+    note_ids: List[Optional[int]] = []
+    for note, response in zip(notes, result):
+        if isinstance(response, dict) and response.get("error"):
+            logger.warning("AnkiConnect rejected note for deck '%s': %s", note.get("deckName"), response["error"])
+            note_ids.append(None)
+        else:
+            note_ids.append(response.get("result") if isinstance(response, dict) else None)
+    return note_ids
+
+
 def find_notes(query: str) -> List[int]:
     """Find notes by query."""
     return _invoke("findNotes", {"query": query})
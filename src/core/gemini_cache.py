@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import atexit
+import hashlib
+import logging
+import shelve
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiCache:
+    """
+    On-disk cache of Gemini results keyed by the inputs that produced them.
+    Entries are never evicted: each is a few hundred bytes, one per distinct favorite ever processed.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._lock = threading.Lock()
+        self._db: Optional[shelve.Shelf[Dict[str, Any]]] = None
+        path.parent.mkdir(parents=True, exist_ok=True)
+        atexit.register(self.close)
+
+    @staticmethod
+    def make_key(text: str, translation: str, model: str) -> str:
+        return hashlib.sha256("␟".join((text, translation, model)).encode("utf-8")).hexdigest()
+
+    def _open(self) -> shelve.Shelf[Dict[str, Any]]:
+        # Called with the lock held; the shelf stays open until close() instead of being reopened per lookup
+        if self._db is None:
+            self._db = shelve.open(str(self._path))
+        return self._db
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with self._lock:
+                return self._open().get(key)
+        except Exception as e:
+            logger.warning("Failed to read Gemini cache at %s: %s", self._path, e)
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        try:
+            with self._lock:
+                self._open()[key] = value
+        except Exception as e:
+            logger.warning("Failed to write Gemini cache at %s: %s", self._path, e)
+
+    def close(self) -> None:
+        """Closes the shelf; the next get or set reopens it."""
+        with self._lock:
+            db, self._db = self._db, None
+            if db is None:
+                return
+            try:
+                db.close()
+            except Exception as e:
+                logger.warning("Failed to close Gemini cache at %s: %s", self._path, e)
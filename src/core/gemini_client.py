@@ -1,16 +1,21 @@
 from __future__ import annotations
 
-import json
+import datetime
 import logging
 import re
+import threading
 import time
-from dataclasses import dataclass
-from typing import Any, Dict, List, Literal, TypedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Dict, List, Literal, Optional, Tuple, TypedDict
 
 import google.generativeai as genai
+from google.generativeai import caching
+import orjson
 from google.api_core.exceptions import GoogleAPIError
 
 from ..utils import config
+from .gemini_cache import GeminiCache
 from .scraper import FavoriteItem # Import FavoriteItem from scraper
 
 logger = logging.getLogger(__name__)
@@ -30,43 +35,53 @@ class GeminiOutput(TypedDict):
     type: Literal["word", "sentence"]
     data: WordData | SentenceData
 
-@dataclass
+# Response schema equivalent to GeminiOutput, enforced server-side in JSON mode.
+# The word and sentence fields share one "data" object because the schema cannot express the union.
+_RESPONSE_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "type": {"type": "string", "format": "enum", "enum": ["word", "sentence"]},
+        "data": {
+            "type": "object",
+            "properties": {
+                field: {"type": "string"}
+                for field in (*WordData.__annotations__, *SentenceData.__annotations__)
+            },
+        },
+    },
+    "required": ["type", "data"],
+}
+
+_GENERATION_CONFIG: Dict[str, Any] = {"response_mime_type": "application/json", "response_schema": _RESPONSE_SCHEMA}
+
+@dataclass(slots=True, frozen=True)
 class ProcessedWord:
     english_word: str
     example_sentence: str
     japanese_meaning: str
     example_translation: str
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ProcessedSentence:
     japanese_sentence: str
     english_sentence: str
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ProcessedItem:
     item_id: str
     type: Literal["word", "sentence"]
     data: ProcessedWord | ProcessedSentence
 
-class GeminiProcessor:
-    MAX_RETRIES = 3
+# Dataclass and field names to build for each item type returned by Gemini
+_BUILDERS: Dict[str, Tuple[type, Tuple[str, ...]]] = {
+    "word": (ProcessedWord, tuple(f.name for f in fields(ProcessedWord))),
+    "sentence": (ProcessedSentence, tuple(f.name for f in fields(ProcessedSentence))),
+}
 
-    def __init__(self) -> None:
-        api_key = config.GEMINI_API_KEY
-        if not api_key:
-            raise RuntimeError("GEMINI_API_KEY is not set in .env")
-        genai.configure(api_key=api_key)  # pyright: ignore [reportPrivateImportUsage]
-        self.model = genai.GenerativeModel(
-            config.GEMINI_MODEL,
-            generation_config={"response_mime_type": "application/json"}
-        )  # pyright: ignore [reportPrivateImportUsage]
-
-    def process_item(self, item: FavoriteItem, retry_count: int = 0) -> ProcessedItem | None:
-        
-        prompt = f"""Given a text and its translation from Google Translate favorites:
 
-- **Text:** {item.text}
-- **Translated Text:** {item.translation}
+# Static instructions, passed as the system instruction (or held in the context cache when enabled)
+# so that each request only carries the item itself.
+_SYSTEM_INSTRUCTION = """You will be given a text and its translation from Google Translate favorites.
 
 Task:
 1. Determine if the text is a 'word/phrase' (not a complete sentence) or a 'sentence' (complete grammatical sentence).
@@ -79,90 +94,226 @@ Task:
 
 Return a JSON object matching this schema:
 - For 'word':
-  {{
+  {
     "type": "word",
-    "data": {{
+    "data": {
       "english_word": "...",
       "example_sentence": "...",
       "japanese_meaning": "...",
       "example_translation": "..."
-    }}
-  }}
+    }
+  }
 - For 'sentence':
-  {{
+  {
     "type": "sentence",
-    "data": {{
+    "data": {
       "english_sentence": "...",
       "japanese_sentence": "..."
-    }}
-  }}
+    }
+  }
 """
-        response_text = ""
+
+
+_PROMPT_HEAD = "- **Text:** "
+_PROMPT_MID = "\n- **Translated Text:** "
+
+
+def _build_prompt(item: FavoriteItem) -> str:
+    return _PROMPT_HEAD + item.text + _PROMPT_MID + item.translation
+
+
+class _RateLimiter:
+    """Thread-safe token bucket that keeps Gemini requests under a requests-per-minute cap (0 disables it)."""
+
+    def __init__(self, rpm: int) -> None:
+        self._capacity = float(rpm)
+        self._tokens = float(rpm)
+        self._rate = rpm / 60.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self._rate <= 0:
+            return
+        # Holding the lock while sleeping queues the waiting workers in turn
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                time.sleep((1 - self._tokens) / self._rate)
+
+
+class GeminiProcessor:
+    MAX_RETRIES = 3
+
+    def __init__(self) -> None:
+        api_key = config.GEMINI_API_KEY
+        if not api_key:
+            raise RuntimeError("GEMINI_API_KEY is not set in .env")
+        genai.configure(api_key=api_key)  # pyright: ignore [reportPrivateImportUsage]
+        self.model = genai.GenerativeModel(
+            config.GEMINI_MODEL,
+            system_instruction=_SYSTEM_INSTRUCTION,
+            generation_config=_GENERATION_CONFIG,
+        )  # pyright: ignore [reportPrivateImportUsage]
+        self._context_cache_expires_at = 0.0
+        self._context_cache_lock = threading.Lock()
+        self._ensure_context_cache()
+        self.cache: GeminiCache | None = GeminiCache(config.GEMINI_CACHE_PATH) if config.GEMINI_CACHE_ENABLED else None
+
+    def process_item(
+        self, item: FavoriteItem, retry_count: int = 0, rate_limiter: Optional[_RateLimiter] = None
+    ) -> ProcessedItem | None:
+        cached = self._get_cached(item)
+        if cached is not None:
+            return cached
         try:
-            response = self.model.generate_content(prompt)
-            json_output = response.text.strip()
+            self._ensure_context_cache()
+            # Only requests that reach the API (including retries) spend a token; cache hits never wait
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            response = self.model.generate_content(_build_prompt(item))
+            result = self._parse_response(item, response.text)
+            self._store_cached(item, result)
+            return result
+        except GoogleAPIError as e:
+            logger.error("Gemini API error for item_id %s: %s", item.item_id, e)
+            retry_delay = self._retry_delay(e, item, retry_count)
+            if retry_delay is not None:
+                time.sleep(retry_delay)
+                return self.process_item(item, retry_count + 1, rate_limiter) # Recursive retry
+            return None
+        except Exception as e:
+            logger.error("Unexpected error during Gemini processing for item_id %s: %s", item.item_id, e)
+            return None
+
+    def process_items(self, items: List[FavoriteItem]) -> List[ProcessedItem | None]:
+        """
+        Processes a batch of favorite items concurrently.
+        Returns one result per input item, in the same order, with None for items that failed.
+        """
+        if not items:
+            return []
+        rate_limiter = _RateLimiter(config.GEMINI_RPM)
+
+        def worker(i: int, item: FavoriteItem) -> ProcessedItem | None:
+            logger.debug("Processing item %d/%d: %s - %s", i + 1, len(items), item.text, item.translation)
+            return self.process_item(item, rate_limiter=rate_limiter)
 
-            # Attempt to find the first '{' and the last '}' to extract the raw JSON string.
-            # (Though response_mime_type should make this less necessary)
+        # Gemini calls are I/O-bound, so a few threads overlap their round trips; map keeps the input order
+        with ThreadPoolExecutor(max_workers=max(1, min(config.GEMINI_CONCURRENCY, len(items)))) as executor:
+            return list(executor.map(worker, range(len(items)), items))
+
+    def _ensure_context_cache(self) -> None:
+        """Creates or renews the server-side cache holding the static instructions when context caching is enabled."""
+        ttl = config.GEMINI_CONTEXT_CACHE_TTL
+        if ttl <= 0 or time.monotonic() < self._context_cache_expires_at:
+            return
+        with self._context_cache_lock:
+            # Another worker thread may have renewed the cache while this one waited for the lock
+            if time.monotonic() < self._context_cache_expires_at:
+                return
+            self._create_context_cache(ttl)
+
+    def _create_context_cache(self, ttl: int) -> None:
+        try:
+            cached_content = caching.CachedContent.create(
+                model=config.GEMINI_MODEL,
+                system_instruction=_SYSTEM_INSTRUCTION,
+                ttl=datetime.timedelta(seconds=ttl),
+            )
+        except Exception as e:
+            # e.g. the instructions are below the model's minimum cacheable token count
+            logger.warning("Could not create Gemini context cache; sending instructions with each request: %s", e)
+            self._context_cache_expires_at = float("inf")
+            return
+        self.model = genai.GenerativeModel.from_cached_content(
+            cached_content, generation_config=_GENERATION_CONFIG
+        )  # pyright: ignore [reportPrivateImportUsage]
+        # Renew a little before the server-side TTL lapses
+        self._context_cache_expires_at = time.monotonic() + max(ttl - 60, ttl / 2)
+        logger.info("Created Gemini context cache %s (TTL %ds).", cached_content.name, ttl)
+
+    def _parse_response(self, item: FavoriteItem, json_output: str) -> ProcessedItem | None:
+        try:
+            # JSON mode with a response schema returns a bare JSON object, so decode it directly.
+            data: GeminiOutput = orjson.loads(json_output)
+        except orjson.JSONDecodeError:
+            # Fall back to the text between the first '{' and the last '}' in case the model wrapped the JSON.
             try:
                 start_index = json_output.index('{')
                 end_index = json_output.rindex('}')
-                json_output = json_output[start_index:end_index + 1]
             except ValueError:
                 logger.error("Could not find a valid JSON object boundary in the response for item_id: %s", item.item_id)
                 return None
+            try:
+                data = orjson.loads(json_output[start_index:end_index + 1])
+            except orjson.JSONDecodeError as e:
+                logger.error("Failed to parse Gemini JSON response for item_id %s: %s\nResponse text: %s", item.item_id, e, json_output)
+                return None
 
-            data: GeminiOutput = json.loads(json_output)
+        item_type = data.get("type")
+        item_data = data.get("data")
 
-            item_type = data.get("type")
-            item_data = data.get("data")
+        if not item_type or not item_data:
+            logger.warning("Gemini response missing 'type' or 'data' for item_id: %s. Response: %s", item.item_id, json_output)
+            return None
 
-            if not item_type or not item_data:
-                logger.warning("Gemini response missing 'type' or 'data' for item_id: %s. Response: %s", item.item_id, json_output)
-                return None
+        return self._to_processed_item(item, item_type, item_data, json_output)
 
-            if item_type == "word":
-                # Ensure all expected keys are present with default empty strings
-                processed_word = ProcessedWord(
-                    english_word=item_data.get("english_word", ""),
-                    example_sentence=item_data.get("example_sentence", ""),
-                    japanese_meaning=item_data.get("japanese_meaning", ""),
-                    example_translation=item_data.get("example_translation", "")
-                )
-                return ProcessedItem(item_id=item.item_id, type="word", data=processed_word)
-            elif item_type == "sentence":
-                # Ensure all expected keys are present with default empty strings
-                processed_sentence = ProcessedSentence(
-                    japanese_sentence=item_data.get("japanese_sentence", ""),
-                    english_sentence=item_data.get("english_sentence", "")
-                )
-                return ProcessedItem(item_id=item.item_id, type="sentence", data=processed_sentence)
-            else:
-                logger.warning("Unknown item type received from Gemini: %s for item_id: %s. Response: %s", item_type, item.item_id, json_output)
-                return None
+    def _to_processed_item(self, item: FavoriteItem, item_type: str, item_data: Dict[str, Any], raw: str) -> ProcessedItem | None:
+        builder = _BUILDERS.get(item_type)
+        if builder is None:
+            logger.warning("Unknown item type received from Gemini: %s for item_id: %s. Response: %s", item_type, item.item_id, raw)
+            return None
+        cls, keys = builder
+        # Ensure all expected keys are present with default empty strings
+        return ProcessedItem(item_id=item.item_id, type=item_type, data=cls(**{k: item_data.get(k, "") for k in keys}))
 
-        except json.JSONDecodeError as e:
-            logger.error("Failed to parse Gemini JSON response for item_id %s: %s\nResponse text: %s", item.item_id, e, response_text)
+    def _get_cached(self, item: FavoriteItem) -> ProcessedItem | None:
+        if self.cache is None:
             return None
-        except GoogleAPIError as e:
-            logger.error("Gemini API error for item_id %s: %s", item.item_id, e)
-            
-            # Check for rate limit error (HTTP 429) and implement retry logic
-            if "429" in str(e) and retry_count < self.MAX_RETRIES:
-                retry_delay = 5.0 # Default fallback delay
-                
-                # Attempt to extract precise retry delay from the error message
-                if hasattr(e, "message"):
-                    match = re.search(r"Please retry in (\d+\.\d+)s", str(e))
-                    if match:
-                        retry_delay = float(match.group(1))
-
-                logger.info("Rate limit exceeded (429). Retrying item_id: %s in %.2f seconds (Attempt %d/%d).", 
-                            item.item_id, retry_delay, retry_count + 1, self.MAX_RETRIES)
-                time.sleep(retry_delay + 1) # Add a small buffer
-                return self.process_item(item, retry_count + 1) # Recursive retry
-            
+        cached = self.cache.get(GeminiCache.make_key(item.text, item.translation, config.GEMINI_MODEL))
+        if cached is None:
             return None
-        except Exception as e:
-            logger.error("Unexpected error during Gemini processing for item_id %s: %s", item.item_id, e)
+        logger.info("Using cached Gemini result for item_id: %s", item.item_id)
+        return self._to_processed_item(item, cached["type"], cached["data"], str(cached))
+
+    def _store_cached(self, item: FavoriteItem, result: ProcessedItem | None) -> None:
+        if self.cache is None or result is None:
+            return
+        self.cache.set(
+            GeminiCache.make_key(item.text, item.translation, config.GEMINI_MODEL),
+            {"type": result.type, "data": asdict(result.data)},
+        )
+
+    def _retry_delay(self, e: GoogleAPIError, item: FavoriteItem, retry_count: int) -> float | None:
+        """Returns how long to wait before retrying a rate-limited (HTTP 429) request, or None to give up."""
+        if "429" not in str(e) or retry_count >= self.MAX_RETRIES:
             return None
+
+        retry_delay = 5.0 # Default fallback delay
+
+        # Attempt to extract precise retry delay from the error message
+        if hasattr(e, "message"):
+            match = re.search(r"Please retry in (\d+\.\d+)s", str(e))
+            if match:
+                retry_delay = float(match.group(1))
+
+        logger.info("Rate limit exceeded (429). Retrying item_id: %s in %.2f seconds (Attempt %d/%d).",
+                    item.item_id, retry_delay, retry_count + 1, self.MAX_RETRIES)
+        return retry_delay + 1 # Add a small buffer
+
+
+# Shared processor so that repeated runs reuse the configured client and model
+_PROCESSOR_INSTANCE: Optional[GeminiProcessor] = None
+
+def get_gemini_processor() -> GeminiProcessor:
+    global _PROCESSOR_INSTANCE
+    if _PROCESSOR_INSTANCE is None:
+        _PROCESSOR_INSTANCE = GeminiProcessor()
+    return _PROCESSOR_INSTANCE
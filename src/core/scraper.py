@@ -2,11 +2,13 @@ from __future__ import annotations
 
 import json
 import logging
-from dataclasses import dataclass
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from importlib import resources
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, Iterator, List, Optional, Tuple, Any
 
-from playwright.sync_api import BrowserContext, Page, Playwright, sync_playwright, Browser, TimeoutError
+from playwright.sync_api import BrowserContext, ElementHandle, Page, Playwright, Route, sync_playwright, Browser, TimeoutError
 import hashlib
 
 from ..utils import config
@@ -14,21 +16,124 @@ from ..utils import config
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+_BLOCKED_RESOURCE_TYPES = frozenset({"image", "font", "media"})
+
+
+def _block_unneeded_resources(route: Route) -> None:
+    if route.request.resource_type in _BLOCKED_RESOURCE_TYPES:
+        route.abort()
+    else:
+        route.continue_()
+
+
+# CSS selectors shipped with the package, parsed once at import and shared by every Scraper (do not mutate)
+_SELECTORS: Dict[str, str] = json.loads(
+    resources.files(config.__package__).joinpath("selectors.json").read_text(encoding="utf-8")
+)
+
+
+# Runs in the page: returns the text and translation of every favorite item in DOM order
+_EXTRACT_FAVORITES_JS = """
+(sel) => Array.from(
+    // Only read the first `limit` rows (null reads all): innerText forces layout for each row it touches
+    Array.prototype.slice.call(document.querySelectorAll(sel.item), 0, sel.limit ?? undefined),
+    (el) => ({
+        text: el.querySelector(sel.text)?.innerText.trim() ?? "",
+        translation: el.querySelector(sel.translation)?.innerText.trim() ?? "",
+    }),
+)
+"""
+
+
+@dataclass(slots=True, frozen=True)
 class FavoriteItem:
     text: str
     translation: str
     item_id: str # A unique ID for the item (e.g., hash of text + translation)
+    dom_index: Optional[int] = field(default=None, compare=False) # Position on the favorites page when fetched
 
 
 class Scraper:
+    """
+    Google Translate favorites scraper.
+    Used as a context manager, it keeps one browser/context/page open for every call made inside the block;
+    otherwise each call launches and tears down its own browser.
+    """
+
     def __init__(self) -> None:
-        self.selectors: Dict[str, str] = self._load_selectors(config.SELECTORS_PATH)
+        self.selectors: Dict[str, str] = _SELECTORS
+        # Selectors used on every call, resolved once
+        self._ready_selector: str = f"{self.selectors['favorites_container']}, {self.selectors['empty_state_indicator']}"
+        self._sel_item: str = self.selectors["favorite_item"]
+        self._sel_text: str = self.selectors["favorite_item_text"]
+        self._sel_trans: str = self.selectors["favorite_item_translation"]
+        self._sel_empty: str = self.selectors["empty_state_indicator"]
+        self._sel_delete: str = self.selectors["favorite_item_delete_button"]
+        self._keep_open: bool = False
+        self._pw: Optional[Playwright] = None
+        self._browser: Optional[Browser] = None
+        self._context: Optional[BrowserContext] = None
+        self._page: Optional[Page] = None
+        self._screenshot_dir: Path = config.DATA_DIR
+
+    @staticmethod
+    def _compute_item_id(text: str, translation: str) -> str:
+        """Returns the dedup key for a favorite: a 128-bit blake2b digest of its text and translation."""
+        return hashlib.blake2b("\x1f".join((text, translation)).encode("utf-8"), digest_size=16).hexdigest()
+
+    def __enter__(self) -> Scraper:
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    @property
+    def is_open(self) -> bool:
+        return self._keep_open
+
+    def open(self) -> None:
+        """Keeps the browser open between calls; it is launched lazily by the first call that needs it."""
+        self._keep_open = True
+
+    def close(self) -> None:
+        """Closes the shared browser, if one was launched, and returns to per-call browsers."""
+        self._keep_open = False
+        page, context, browser, pw = self._page, self._context, self._browser, self._pw
+        self._page = self._context = self._browser = self._pw = None
+        try:
+            if page is not None:
+                page.close()
+            if context is not None:
+                context.close()
+            if browser is not None:
+                browser.close()
+        except Exception as e:
+            logger.warning("Error while closing the shared browser: %s", e)
+        finally:
+            if pw is not None:
+                pw.stop()
+
+    @contextmanager
+    def _page_for_call(self) -> Iterator[Page]:
+        """Yields the shared page while the scraper is open, otherwise a page that lives for this call only."""
+        if self._keep_open:
+            if self._page is None:
+                self._pw = sync_playwright().start()
+                self._context, self._browser = self._new_context(self._pw, manual_login=False)
+                self._page = self._context.new_page()
+            yield self._page
+            return
 
-    def _load_selectors(self, file_path: Path) -> Dict[str, str]:
-        """Loads CSS selectors from a JSON file."""
-        with open(file_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with sync_playwright() as pw:
+            context, browser = self._new_context(pw, manual_login=False)
+            page: Page = context.new_page()
+            try:
+                yield page
+            finally:
+                page.close()
+                context.close()
+                browser.close()
 
     def _new_context(self, pw: Playwright, manual_login: bool) -> Tuple[BrowserContext, Browser]:
         """Creates a new Playwright browser context with common options."""
@@ -41,6 +146,9 @@ class Scraper:
                 "--disable-blink-features=AutomationControlled",
                 "--disk-cache-size=0",
                 "--media-cache-size=0",
+                "--disable-dev-shm-usage",
+                "--disable-gpu",
+                *([] if manual_login or not config.PLAYWRIGHT_BLOCK_RESOURCES else ["--blink-settings=imagesEnabled=false"]),
             ],
         )
 
@@ -56,168 +164,199 @@ class Scraper:
             context_options["storage_state"] = str(config.AUTH_STATE_PATH)
 
         context: BrowserContext = browser.new_context(**context_options)
+        # Only text is scraped, so skip downloading assets (kept for manual login, where a human uses the page)
+        if config.PLAYWRIGHT_BLOCK_RESOURCES and not manual_login:
+            context.route("**/*", _block_unneeded_resources)
         return context, browser
 
     def ensure_logged_in(self, manual_login: bool = False, timeout_sec: int = 300) -> None:
         """Ensures the user is logged into Google Translate favorites."""
-        with sync_playwright() as pw:
-            context, browser = self._new_context(pw, manual_login=manual_login)
-            page: Page = context.new_page()
-            try:
-                logger.info("Opening favorites page for login check...")
-                page.goto(config.GOOGLE_TRANSLATE_FAVORITES_URL, wait_until="domcontentloaded", timeout=60000)
-                logger.info("Current URL after navigation: %s", page.url)
-
-                if manual_login:
-                    logger.info("Manual login mode: please authenticate in the opened browser.")
-                    input("Press Enter when you have finished logging in and the favorites page is loaded...")
-
-                ready_selector: str = f"{self.selectors['favorites_container']}, {self.selectors['empty_state_indicator']}"
-                logger.info("Waiting for page to be ready (either list or empty state)...")
-                page.locator(ready_selector).first.wait_for(timeout=timeout_sec * 1000)
-                logger.info("Page is ready. Saving auth state.")
-
-                context.storage_state(path=str(config.AUTH_STATE_PATH))
-                logger.info("Saved auth state to %s", config.AUTH_STATE_PATH)
-
-            except TimeoutError as e:
-                logger.error("Timeout during login check/setup: %s", e)
-                screenshot_path = config.DATA_DIR / "error_ensure_logged_in_timeout.png"
-                page.screenshot(path=str(screenshot_path))
-                logger.error("Screenshot saved to %s", screenshot_path)
-                raise
-            except Exception as e:
-                logger.error("Error during login check/setup: %s", e, exc_info=True)
-                screenshot_path = config.DATA_DIR / "error_ensure_logged_in.png"
-                page.screenshot(path=str(screenshot_path))
-                logger.error("Screenshot saved to %s", screenshot_path)
-                raise
-            finally:
-                page.close()
-                context.close()
-                browser.close()
+        if manual_login:
+            # Manual login needs a headed browser, so it never reuses the shared (possibly headless) one
+            with sync_playwright() as pw:
+                context, browser = self._new_context(pw, manual_login=True)
+                page: Page = context.new_page()
+                try:
+                    self._check_login(page, manual_login=True, timeout_sec=timeout_sec)
+                finally:
+                    page.close()
+                    context.close()
+                    browser.close()
+            return
+
+        with self._page_for_call() as page:
+            self._check_login(page, manual_login=False, timeout_sec=timeout_sec)
+
+    def _check_login(self, page: Page, manual_login: bool, timeout_sec: int) -> None:
+        try:
+            logger.info("Opening favorites page for login check...")
+            page.goto(config.GOOGLE_TRANSLATE_FAVORITES_URL, wait_until="domcontentloaded", timeout=60000)
+            logger.info("Current URL after navigation: %s", page.url)
+
+            if manual_login:
+                logger.info("Manual login mode: please authenticate in the opened browser.")
+                input("Press Enter when you have finished logging in and the favorites page is loaded...")
+
+            logger.info("Waiting for page to be ready (either list or empty state)...")
+            page.locator(self._ready_selector).first.wait_for(timeout=timeout_sec * 1000)
+            logger.info("Page is ready. Saving auth state.")
+
+            page.context.storage_state(path=str(config.AUTH_STATE_PATH))
+            logger.info("Saved auth state to %s", config.AUTH_STATE_PATH)
+
+        except TimeoutError as e:
+            logger.error("Timeout during login check/setup: %s", e)
+            self._save_error_screenshot(page, "ensure_logged_in_timeout")
+            raise
+        except Exception as e:
+            logger.error("Error during login check/setup: %s", e, exc_info=True)
+            self._save_error_screenshot(page, "ensure_logged_in")
+            raise
+
+    def _save_error_screenshot(self, page: Page, name: str) -> None:
+        """Saves a screenshot for debugging on a best-effort basis, so it can neither stall nor mask the original error."""
+        if not config.CAPTURE_ERROR_SCREENSHOTS:
+            return
+        screenshot_path = self._screenshot_dir / f"error_{name}.png"
+        try:
+            page.screenshot(path=str(screenshot_path), timeout=2000)
+            logger.error("Screenshot saved to %s", screenshot_path)
+        except Exception as e:
+            logger.warning("Could not save screenshot to %s: %s", screenshot_path, e)
 
     def fetch_favorites(self, limit: Optional[int] = None) -> List[FavoriteItem]:
         """Fetches favorite items from Google Translate."""
         items: List[FavoriteItem] = []
 
-        with sync_playwright() as pw:
-            context, browser = self._new_context(pw, manual_login=False)
-            page: Page = context.new_page()
-
+        with self._page_for_call() as page:
             try:
                 logger.info("Navigating to favorites page...")
                 page.goto(config.GOOGLE_TRANSLATE_FAVORITES_URL, wait_until="domcontentloaded", timeout=60000)
                 logger.info("Current URL after navigation: %s", page.url)
 
-                ready_selector: str = f"{self.selectors['favorites_container']}, {self.selectors['empty_state_indicator']}"
                 logger.info("Waiting for page content (either list or empty state)...")
-                page.locator(ready_selector).first.wait_for(timeout=30000)
+                page.locator(self._ready_selector).first.wait_for(timeout=30000)
                 logger.info("Page content is ready.")
 
-                empty_state_locator = page.locator(self.selectors["empty_state_indicator"])
+                empty_state_locator = page.locator(self._sel_empty)
                 if empty_state_locator.count() > 0:
                     logger.info("Empty state indicator found. No favorite items to process.")
                     return []
 
                 logger.info("Extracting favorite items...")
-                favorite_elements = page.locator(self.selectors["favorite_item"]).all()
-                logger.info("Found %d favorite items.", len(favorite_elements))
-
-                for i, element in enumerate(favorite_elements):
-                    if limit and i >= limit:
-                        logger.info("Reached limit of %d items. Stopping scraping.", limit)
-                        break
-
-                    try:
-                        text_element = element.locator(self.selectors["favorite_item_text"]).first
-                        translation_element = element.locator(self.selectors["favorite_item_translation"]).first
-
-                        text = text_element.inner_text().strip() if text_element else ""
-                        translation = translation_element.inner_text().strip() if translation_element else ""
-
-                        if text and translation:
-                            item_id = hashlib.sha256(f"{text}-{translation}".encode()).hexdigest()
-                            items.append(FavoriteItem(text=text, translation=translation, item_id=item_id))
-                        else:
-                            logger.warning(
-                                "Skipping item due to missing text or translation: Text='%s', Translation='%s'",
-                                text,
-                                translation,
-                            )
-
-                    except Exception as e:
-                        logger.error("Error extracting data from favorite item %d: %s", i, e)
-                        continue
+                # Read every item's text and translation inside the page in one round trip
+                raw_items: List[Dict[str, str]] = page.evaluate(
+                    _EXTRACT_FAVORITES_JS,
+                    {
+                        "item": self._sel_item,
+                        "text": self._sel_text,
+                        "translation": self._sel_trans,
+                        "limit": limit or None,
+                    },
+                )
+                logger.info("Found %d favorite items.", len(raw_items))
+
+                if limit and len(raw_items) == limit:
+                    logger.info("Reached limit of %d items. Stopping scraping.", limit)
+
+                for dom_index, raw_item in enumerate(raw_items):
+                    text = raw_item["text"]
+                    translation = raw_item["translation"]
+
+                    if text and translation:
+                        item_id = self._compute_item_id(text, translation)
+                        items.append(FavoriteItem(text=text, translation=translation, item_id=item_id, dom_index=dom_index))
+                    else:
+                        logger.warning(
+                            "Skipping item due to missing text or translation: Text='%s', Translation='%s'",
+                            text,
+                            translation,
+                        )
 
             except TimeoutError as e:
                 logger.error("Timeout during fetching favorites: %s", e)
-                screenshot_path = config.DATA_DIR / "error_fetch_favorites_timeout.png"
-                page.screenshot(path=str(screenshot_path))
-                logger.error("Screenshot saved to %s", screenshot_path)
+                self._save_error_screenshot(page, "fetch_favorites_timeout")
                 return []
             except Exception as e:
                 logger.error("Error during fetching favorites: %s", e, exc_info=True)
-                screenshot_path = config.DATA_DIR / "error_fetch_favorites.png"
-                page.screenshot(path=str(screenshot_path))
-                logger.error("Screenshot saved to %s", screenshot_path)
+                self._save_error_screenshot(page, "fetch_favorites")
                 return []
-            finally:
-                page.close()
-                context.close()
-                browser.close()
 
             return items
 
+    def _find_item_row(self, page: Page, item: FavoriteItem) -> Optional[ElementHandle]:
+        """
+        Finds the row for an item: by the DOM index recorded by fetch_favorites when that row still holds the item,
+        otherwise by searching the rows for its text.
+        """
+        if item.dom_index is not None:
+            try:
+                row = page.locator(self._sel_item).nth(item.dom_index)
+                if row.locator(self._sel_text).first.inner_text(timeout=1000).strip() == item.text:
+                    return row.element_handle(timeout=1000)
+            except Exception as e:
+                logger.debug("Could not use DOM index %d for item %s: %s", item.dom_index, item.text, e)
+            logger.debug("DOM index no longer matches item %s. Falling back to a text search.", item.text)
+
+        # Use a more robust selector for the item, escaping quotes in item.text
+        escaped_item_text = item.text.replace('"', '\\"')
+        item_selector: str = f"{self._sel_item}:has-text(\"{escaped_item_text}\")"
+        target_item_locator = page.locator(item_selector).first
+        if target_item_locator.count() == 0:
+            return None
+        return target_item_locator.element_handle()
+
     def delete_favorite_item(self, item: FavoriteItem) -> bool:
         """Deletes a single item from Google Translate favorites."""
-        return self.delete_favorite_items([item]) > 0
-
-    def delete_favorite_items(self, items: List[FavoriteItem]) -> int:
-        """Deletes multiple items from Google Translate favorites in a single browser session."""
+        return self.delete_favorite_items([item]).get(item.item_id, False)
+
+    def delete_favorite_items(self, items: List[FavoriteItem]) -> Dict[str, bool]:
+        """
+        Deletes multiple items from Google Translate favorites with a single page load.
+        Returns whether each item was deleted, keyed by item_id.
+        """
+        results: Dict[str, bool] = {item.item_id: False for item in items}
         if not items:
-            return 0
-
-        deleted_count = 0
-        with sync_playwright() as pw:
-            context, browser = self._new_context(pw, manual_login=False)
-            page: Page = context.new_page()
+            return results
 
+        with self._page_for_call() as page:
             try:
                 logger.info("Navigating to favorites page for batch deletion...")
                 page.goto(config.GOOGLE_TRANSLATE_FAVORITES_URL, wait_until="domcontentloaded", timeout=60000)
 
-                for item in items:
+                page.locator(self._ready_selector).first.wait_for(timeout=30000)
+
+                # Work from the bottom of the list up so that the DOM indices recorded by fetch_favorites
+                # stay valid for the rows not deleted yet
+                for item in sorted(items, key=lambda it: -1 if it.dom_index is None else it.dom_index, reverse=True):
                     try:
-                        # Use a more robust selector for the item, escaping quotes in item.text
-                        escaped_item_text = item.text.replace('"', '\\"')
-                        item_selector: str = f"{self.selectors['favorite_item']}:has-text(\"{escaped_item_text}\")"
                         logger.debug("Attempting to find item to delete: %s", item.text)
-
-                        target_item_locator = page.locator(item_selector).first
-                        # Check visibility with a shorter timeout for batch processing
-                        if target_item_locator.count() == 0:
+                        row = self._find_item_row(page, item)
+                        if row is None:
                             logger.warning("Item to delete not found: %s", item.text)
                             continue
 
-                        delete_button = target_item_locator.locator(self.selectors['favorite_item_delete_button']).first
+                        delete_button = row.query_selector(self._sel_delete)
+                        if delete_button is None:
+                            logger.warning("Delete button not found for item: %s", item.text)
+                            continue
                         delete_button.click()
 
                         # Wait for the item to disappear from the DOM
-                        target_item_locator.wait_for(state="hidden", timeout=5000)
+                        row.wait_for_element_state("hidden", timeout=5000)
                         logger.info("Successfully deleted item: %s", item.text)
-                        deleted_count += 1
+                        results[item.item_id] = True
                     except Exception as e:
                         logger.error("Failed to delete item %s: %s", item.text, e)
 
             except Exception as e:
                 logger.error("Error during batch deletion: %s", e, exc_info=True)
-            finally:
-                page.close()
-                context.close()
-                browser.close()
 
-        return deleted_count
+        return results
+
+def legacy_item_id(item: FavoriteItem) -> str:
+    """Returns the sha256-based ID that earlier versions stored for this item in processed_ids."""
+    return hashlib.sha256(f"{item.text}-{item.translation}".encode()).hexdigest()
 
 # Functions for backward compatibility and simpler access
 _SCRAPER_INSTANCE: Optional[Scraper] = None
@@ -237,5 +376,15 @@ def fetch_favorites(limit: Optional[int] = None) -> List[FavoriteItem]:
 def delete_favorite_item(item: FavoriteItem) -> bool:
     return _get_scraper().delete_favorite_item(item)
 
-def delete_favorite_items(items: List[FavoriteItem]) -> int:
+def delete_favorite_items(items: List[FavoriteItem]) -> Dict[str, bool]:
     return _get_scraper().delete_favorite_items(items)
+
+@contextmanager
+def browser_session() -> Iterator[Scraper]:
+    """Keeps the shared scraper's browser open across every call made inside the block."""
+    scraper = _get_scraper()
+    if scraper.is_open:
+        yield scraper
+        return
+    with scraper:
+        yield scraper
@@ -2,14 +2,21 @@ from __future__ import annotations
 
 import argparse
 import logging
-from typing import List, Set, Tuple, Optional
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import replace
+from itertools import islice
+from typing import Any, Callable, ContextManager, Dict, List, Set, Tuple
+
+import orjson
 
 from .utils import config
 from .utils.logging_setup import setup_logging
-from .core.scraper import ensure_logged_in, fetch_favorites, delete_favorite_item, FavoriteItem
-from .core.gemini_client import GeminiProcessor, ProcessedItem, ProcessedWord, ProcessedSentence
-from .core.anki_client import ensure_deck_and_model, format_word_note, format_sentence_note, add_note, AnkiNote
-from .utils.storage import load_ids, save_ids
+from .core.scraper import browser_session, ensure_logged_in, fetch_favorites, delete_favorite_items, legacy_item_id, FavoriteItem
+from .core.gemini_client import get_gemini_processor
+from .core.anki_client import close_session, ensure_deck_and_model, format_word_note, format_sentence_note, add_notes, can_add_notes, AnkiNote
+from .utils.storage import append_ids, load_ids
 
 
 logger = logging.getLogger("main")
@@ -17,7 +24,7 @@ logger = logging.getLogger("main")
 def _load_and_filter_favorites(
     limit: int, processed_item_ids: Set[str], skip_browser: bool
 ) -> Tuple[List[FavoriteItem], List[FavoriteItem]]:
-    """Loads favorites and splits them into new and already processed items."""
+    """Loads favorites once and splits them into new and already processed items, keeping their page order."""
     if skip_browser:
         logger.info("Skipping browser operation as --skip-browser is enabled.")
         return [], []
@@ -25,8 +32,18 @@ def _load_and_filter_favorites(
     logger.info("Fetching favorite items from Google Translate...")
     favorites = fetch_favorites(limit=limit)
 
-    new_items = [f for f in favorites if f.item_id not in processed_item_ids]
-    stale_items = [f for f in favorites if f.item_id in processed_item_ids]
+    # Index by ID (in page order) so that the processed items fall out of one set intersection
+    favorites_by_id: Dict[str, FavoriteItem] = {f.item_id: f for f in favorites}
+    stale_ids = favorites_by_id.keys() & processed_item_ids
+    # IDs recorded before the switch to blake2b are 64-char sha256 digests; only look them up if any remain
+    if any(len(item_id) == 64 for item_id in processed_item_ids):
+        stale_ids |= {
+            item_id
+            for item_id, f in favorites_by_id.items()
+            if item_id not in stale_ids and legacy_item_id(f) in processed_item_ids
+        }
+    new_items: List[FavoriteItem] = [f for item_id, f in favorites_by_id.items() if item_id not in stale_ids]
+    stale_items: List[FavoriteItem] = [f for item_id, f in favorites_by_id.items() if item_id in stale_ids]
 
     logger.info(
         "Found %d favorite items: %d new, %d already processed.",
@@ -41,29 +58,28 @@ def _process_new_favorites(
     new_favorites: List[FavoriteItem], limit: int, dry_run: bool
 ) -> Tuple[List[Tuple[AnkiNote, FavoriteItem]], Set[str]]:
     """Processes new favorite items using Gemini AI and prepares Anki notes paired with their source items."""
-    gemini_processor = GeminiProcessor()
     note_item_pairs: List[Tuple[AnkiNote, FavoriteItem]] = []
     newly_processed_ids: Set[str] = set()
 
-    logger.info("Processing %d new items with Gemini AI...", len(new_favorites))
-    for i, item in enumerate(new_favorites):
-        if dry_run and i >= limit:
-            logger.info(
-                "Dry run limit of %d reached for Gemini processing. Skipping remaining items.",
-                limit,
-            )
-            break
-
+    items = new_favorites[:limit] if dry_run else new_favorites
+    if len(items) < len(new_favorites):
         logger.info(
-            "Processing item %d/%d: %s - %s", i + 1, len(new_favorites), item.text, item.translation
+            "Dry run limit of %d reached for Gemini processing. Skipping remaining items.",
+            limit,
         )
-        processed_item: Optional[ProcessedItem] = gemini_processor.process_item(item)
+    if not items:
+        return note_item_pairs, newly_processed_ids
 
+    logger.info("Processing %d new items with Gemini AI...", len(items))
+    processed_items = get_gemini_processor().process_items(items)
+    formatters: Dict[str, Callable[[Any], AnkiNote]] = {
+        "word": format_word_note,
+        "sentence": format_sentence_note,
+    }
+
+    for item, processed_item in zip(items, processed_items):
         if processed_item:
-            if processed_item.type == "word" and isinstance(processed_item.data, ProcessedWord):
-                note_item_pairs.append((format_word_note(processed_item.data), item))
-            elif processed_item.type == "sentence" and isinstance(processed_item.data, ProcessedSentence):
-                note_item_pairs.append((format_sentence_note(processed_item.data), item))
+            note_item_pairs.append((formatters[processed_item.type](processed_item.data), item))
             newly_processed_ids.add(item.item_id)
         else:
             logger.warning("Failed to process item: %s. Skipping.", item.text)
@@ -80,12 +96,26 @@ def _add_notes_to_anki(
     ensure_deck_and_model(config.ANKI_WORD_DECK_NAME, config.ANKI_WORD_NOTE_TYPE)
     ensure_deck_and_model(config.ANKI_SENTENCE_DECK_NAME, config.ANKI_SENTENCE_NOTE_TYPE)
 
-    logger.info("Adding %d notes to Anki one by one...", len(note_item_pairs))
+    logger.info("Adding %d notes to Anki in a single batch...", len(note_item_pairs))
     successfully_added_items: List[FavoriteItem] = []
 
-    for note, original_favorite_item in note_item_pairs:
-        note_id = add_note(note)
+    # Drop notes Anki would reject up front so that only valid notes are submitted
+    addable_pairs: List[Tuple[AnkiNote, FavoriteItem]] = []
+    for can_add, (note, original_favorite_item) in zip(
+        can_add_notes([note for note, _ in note_item_pairs]), note_item_pairs
+    ):
+        if can_add:
+            addable_pairs.append((note, original_favorite_item))
+        else:
+            logger.warning(
+                "Skipping note for item '%s': rejected by AnkiConnect canAddNotes (Deck: %s, Model: %s).",
+                original_favorite_item.text,
+                note.get("deckName"),
+                note.get("modelName"),
+            )
 
+    note_ids = add_notes([note for note, _ in addable_pairs])
+    for note_id, (_, original_favorite_item) in zip(note_ids, addable_pairs):
         if note_id is not None:
             successfully_added_items.append(original_favorite_item)
             logger.info(
@@ -102,35 +132,54 @@ def _add_notes_to_anki(
         len(note_item_pairs),
     )
 
-    for item in successfully_added_items:
-        processed_item_ids.add(item.item_id)
-    save_ids(config.PROCESSED_IDS_PATH, processed_item_ids)
-    logger.info("Updated processed_ids.json with %d items.", len(processed_item_ids))
+    added_ids = [item.item_id for item in successfully_added_items]
+    processed_item_ids.update(added_ids)
+    append_ids(config.PROCESSED_IDS_PATH, added_ids)
+    logger.info("Recorded %d newly processed items (%d total).", len(added_ids), len(processed_item_ids))
     return successfully_added_items
 
 
 def _delete_processed_favorites(
     successfully_added_items: List[FavoriteItem], skip_browser: bool
-) -> None:
-    """Deletes successfully added items from Google Translate favorites."""
+) -> List[FavoriteItem]:
+    """Deletes successfully added items from Google Translate favorites and returns the ones deleted."""
+    deleted_items: List[FavoriteItem] = []
     if not skip_browser:
         logger.info(
             "Deleting %d successfully added items from Google Translate favorites...",
             len(successfully_added_items),
         )
-        deleted_count = 0
+        # A single page load deletes every item; Playwright's sync API cannot be shared across threads
+        results = delete_favorite_items(successfully_added_items)
         for item in successfully_added_items:
-            if delete_favorite_item(item):
-                deleted_count += 1
+            if results.get(item.item_id, False):
+                deleted_items.append(item)
             else:
                 logger.warning(
                     "Failed to delete item %s from Google Translate favorites.", item.text
                 )
         logger.info(
-            "Successfully deleted %d items from Google Translate favorites.", deleted_count
+            "Successfully deleted %d items from Google Translate favorites.", len(deleted_items)
         )
     else:
         logger.info("Skipping deletion from Google Translate favorites as --skip-browser is enabled.")
+    return deleted_items
+
+
+def _shift_dom_indices(items: List[FavoriteItem], removed: List[FavoriteItem]) -> List[FavoriteItem]:
+    """Moves each item's DOM index up past the removed rows above it, instead of fetching the page again."""
+    removed_indices = sorted(f.dom_index for f in removed if f.dom_index is not None)
+    if not removed_indices:
+        return items
+    return [
+        f if f.dom_index is None else replace(f, dom_index=f.dom_index - bisect_left(removed_indices, f.dom_index))
+        for f in items
+    ]
+
+
+def _browser_session(skip_browser: bool) -> ContextManager[Any]:
+    """Reuses one browser for the scraper calls in the block, unless browser operations are skipped."""
+    return nullcontext() if skip_browser else browser_session()
 
 
 def run_once(limit: int, dry_run: bool, skip_browser: bool) -> None:
@@ -139,43 +188,52 @@ def run_once(limit: int, dry_run: bool, skip_browser: bool) -> None:
     processed_item_ids: Set[str] = load_ids(config.PROCESSED_IDS_PATH)
     logger.info("Loaded %d already processed items.", len(processed_item_ids))
 
-    new_favorites, stale_favorites = _load_and_filter_favorites(limit, processed_item_ids, skip_browser)
-
-    if stale_favorites:
-        logger.info(
-            "Found %d already processed items in Google Translate. Cleaning up...",
-            len(stale_favorites),
-        )
-        _delete_processed_favorites(stale_favorites, skip_browser)
+    # One browser serves the whole run; Gemini processing runs in worker threads and never touches it
+    with _browser_session(skip_browser):
+        new_favorites, stale_favorites = _load_and_filter_favorites(limit, processed_item_ids, skip_browser)
 
-    if not new_favorites:
-        logger.info("No new items to process. Exiting run.")
-        return
-
-    note_item_pairs, newly_processed_ids = _process_new_favorites(new_favorites, limit, dry_run)
-
-    if not note_item_pairs:
-        logger.info("No notes were successfully processed for Anki. Exiting.")
-        return
+        # Gemini processing runs in the background while this thread, which owns the browser, cleans up stale items
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            processing = (
+                executor.submit(_process_new_favorites, new_favorites, limit, dry_run) if new_favorites else None
+            )
 
-    if dry_run:
-        logger.info("Dry run enabled. Skipping Anki card creation and deletion from Google Favorites.")
-        for note, _ in note_item_pairs:
+            deleted_stale: List[FavoriteItem] = []
+            if stale_favorites:
+                logger.info(
+                    "Found %d already processed items in Google Translate. Cleaning up...",
+                    len(stale_favorites),
+                )
+                deleted_stale = _delete_processed_favorites(stale_favorites, skip_browser)
+
+        if processing is None:
+            logger.info("No new items to process. Exiting run.")
+            return
+
+        note_item_pairs, newly_processed_ids = processing.result()
+
+        if not note_item_pairs:
+            logger.info("No notes were successfully processed for Anki. Exiting.")
+            return
+
+        if dry_run:
+            logger.info("Dry run enabled. Skipping Anki card creation and deletion from Google Favorites.")
+            if logger.isEnabledFor(logging.INFO):
+                # Serialize every note once as compact JSON rather than formatting a dict repr per note
+                payload = orjson.dumps([
+                    {"deck": note.get("deckName"), "model": note.get("modelName"), "fields": note.get("fields")}
+                    for note, _ in note_item_pairs
+                ])
+                logger.info("DRY RUN - Anki Notes: %s", payload.decode())
             logger.info(
-                "DRY RUN - Anki Note (Deck: %s, Model: %s): %s",
-                note.get("deckName"),
-                note.get("modelName"),
-                note.get("fields"),
+                "DRY RUN - Would mark %d items as processed: %s",
+                len(newly_processed_ids),
+                tuple(islice(newly_processed_ids, 5)),
             )
-        logger.info(
-            "DRY RUN - Would mark %d items as processed: %s",
-            len(newly_processed_ids),
-            list(newly_processed_ids)[:5],
-        )
-        return
+            return
 
-    successfully_added_items = _add_notes_to_anki(note_item_pairs, processed_item_ids)
-    _delete_processed_favorites(successfully_added_items, skip_browser)
+        successfully_added_items = _add_notes_to_anki(note_item_pairs, processed_item_ids)
+        _delete_processed_favorites(_shift_dom_indices(successfully_added_items, deleted_stale), skip_browser)
 
 
 def main() -> int:
@@ -192,11 +250,14 @@ def main() -> int:
         ensure_logged_in(manual_login=True)
         return 0
 
-    if args.once:
-        run_once(limit=args.limit, dry_run=args.dry_run, skip_browser=args.skip_browser)
-    else:
-        logger.info("Running in continuous mode. This feature is not yet fully implemented.")
-        run_once(limit=args.limit, dry_run=args.dry_run, skip_browser=args.skip_browser)
+    try:
+        if args.once:
+            run_once(limit=args.limit, dry_run=args.dry_run, skip_browser=args.skip_browser)
+        else:
+            logger.info("Running in continuous mode. This feature is not yet fully implemented.")
+            run_once(limit=args.limit, dry_run=args.dry_run, skip_browser=args.skip_browser)
+    finally:
+        close_session()
 
     return 0
 
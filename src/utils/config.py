@@ -11,7 +11,6 @@ load_dotenv()
 # Directories
 BASE_DIR: Path = Path(__file__).resolve().parent.parent.parent
 DATA_DIR: Path = BASE_DIR / "data"
-SELECTORS_PATH: Path = BASE_DIR / "src" / "utils" / "selectors.json"
 
 # Ensure DATA_DIR exists
 DATA_DIR.mkdir(parents=True, exist_ok=True)
@@ -20,11 +19,24 @@ AUTH_STATE_PATH: Path = DATA_DIR / "auth_state.json"
 PROCESSED_IDS_PATH: Path = DATA_DIR / "processed_ids.json"
 APP_LOG_PATH: Path = DATA_DIR / "app.log"
 SERVICE_ACCOUNT_PATH: Path = DATA_DIR / "service_account.json"
+GEMINI_CACHE_PATH: Path = DATA_DIR / "gemini_cache"
 
 
 # External services
 GEMINI_API_KEY: str = os.environ.get("GEMINI_API_KEY", "")
 GEMINI_MODEL: str = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash")
+# Gemini への同時リクエスト数と、1分あたりのリクエスト上限（0で無制限）
+GEMINI_CONCURRENCY: int = int(os.environ.get("GEMINI_CONCURRENCY", "5"))
+GEMINI_RPM: int = int(os.environ.get("GEMINI_RPM", "15"))
+# 固定の指示文を Gemini のコンテキストキャッシュに載せる TTL（秒）。0 で無効。
+# 指示文がモデルの最小キャッシュトークン数に満たない場合は作成に失敗し、通常のリクエストにフォールバックする
+GEMINI_CONTEXT_CACHE_TTL: int = int(os.environ.get("GEMINI_CONTEXT_CACHE_TTL", "0"))
+# 同じ (原文, 翻訳) の組み合わせに対する Gemini の結果をディスクにキャッシュする
+GEMINI_CACHE_ENABLED: bool = os.environ.get("GEMINI_CACHE_ENABLED", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
 
 # AnkiConnect
 ANKICONNECT_URL: str = os.environ.get("ANKICONNECT_URL", "http://localhost:8765")
@@ -52,6 +64,18 @@ PLAYWRIGHT_HEADLESS: bool = os.environ.get("PLAYWRIGHT_HEADLESS", "true").lower(
     "true",
     "yes",
 )
+# 画像・フォント・メディアの読み込みをブロックしてページ読み込みを速くする（手動ログイン時は常に無効）
+PLAYWRIGHT_BLOCK_RESOURCES: bool = os.environ.get("PLAYWRIGHT_BLOCK_RESOURCES", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+# エラー発生時にページのスクリーンショットを DATA_DIR に保存する（CI などでは false にする）
+CAPTURE_ERROR_SCREENSHOTS: bool = os.environ.get("CAPTURE_ERROR_SCREENSHOTS", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
 PLAYWRIGHT_USER_AGENT: str = os.environ.get(
     "PLAYWRIGHT_USER_AGENT",
     "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.0 Safari/537.36",
@@ -1,12 +1,27 @@
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
-from typing import Union
+from typing import Optional, Union
 
 from . import config
 
+# Listener thread that performs the actual file/console writes for records queued by the root logger
+_listener: Optional[QueueListener] = None
+
+
+def _stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
 
 def setup_logging() -> None:
+    global _listener
     # Ensure data directory exists for logs
     log_path: Path = config.APP_LOG_PATH
     log_path.parent.mkdir(parents=True, exist_ok=True)
@@ -18,6 +33,7 @@ def setup_logging() -> None:
     # Iterate over a copy of the list to avoid issues when modifying it
     for handler in root_logger.handlers[:]:
         root_logger.removeHandler(handler)
+    _stop_listener()
 
     # Create formatter
     formatter: logging.Formatter = logging.Formatter(
@@ -38,6 +54,12 @@ def setup_logging() -> None:
     log_level: Union[int, str] = getattr(logging, config.LOG_LEVEL, logging.INFO)
     root_logger.setLevel(log_level)
 
-    # Add handlers to root logger
-    root_logger.addHandler(file_handler)
-    root_logger.addHandler(stream_handler)
+    # Route records through a queue so that callers never block on file or console I/O;
+    # the listener thread hands them to the real handlers
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    _listener.start()
+    root_logger.addHandler(QueueHandler(log_queue))
+
+
+atexit.register(_stop_listener)
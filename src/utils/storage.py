@@ -1,42 +1,75 @@
-import json
 import logging
+import os
 from pathlib import Path
-from typing import Iterable, Set, List, Any
+from typing import Any, Iterable, List, Optional, Set
+
+import orjson
 
 logger = logging.getLogger(__name__)
 
 
-def load_ids(path: Path) -> Set[str]:
-    """Loads a set of IDs from a JSON file."""
-    if not path.exists():
-        logger.info("ID file not found at %s. Returning empty set.", path)
-        return set()
+def _load_legacy_json_ids(path: Path, content: bytes) -> Optional[Set[str]]:
+    """Parses the legacy JSON list format used before IDs were stored one per line. Returns None if it does not decode."""
     try:
-        with path.open("r", encoding="utf-8") as f:
-            data: Any = json.load(f)
-            if isinstance(data, list):
-                return set(str(x) for x in data)
-            logger.warning("Content of %s is not a list. Returning empty set.", path)
-            return set()
-    except json.JSONDecodeError as e:
+        data: Any = orjson.loads(content)
+    except orjson.JSONDecodeError as e:
         logger.error("Failed to decode JSON from %s: %s", path, e)
+        return None
+    if isinstance(data, list):
+        return set(str(x) for x in data)
+    logger.warning("Content of %s is not a list. Returning empty set.", path)
+    return set()
+
+
+def load_ids(path: Path) -> Set[str]:
+    """
+    Loads a set of IDs from a file with one ID per line (legacy JSON lists are also accepted).
+    Legacy files are migrated and heavily duplicated logs are compacted as a side effect.
+    """
+    try:
+        # orjson parses bytes directly, so the file is only decoded for the line format
+        content: bytes = path.read_bytes()
+    except FileNotFoundError:
+        logger.info("ID file not found at %s. Returning empty set.", path)
         return set()
     except IOError as e:
         logger.error("IO error while reading %s: %s", path, e)
         return set()
+    try:
+        if content.lstrip().startswith((b"[", b"{")):
+            legacy_ids = _load_legacy_json_ids(path, content)
+            if legacy_ids is None:
+                # Move the unreadable file aside so that append_ids starts a fresh log instead of adding to it
+                corrupt_path = path.with_name(path.name + ".corrupt")
+                os.replace(path, corrupt_path)
+                logger.error("Moved unreadable ID file %s to %s.", path, corrupt_path)
+                return set()
+            # Always rewrite in the line format (even when empty) so that append_ids can add to it
+            save_ids(path, legacy_ids)
+            return legacy_ids
+        ids = set(content.decode("utf-8").split())
+        # Compact the append-only log once duplicates make it more than twice its minimal size
+        if len(content) > 2 * sum(len(item_id) + 1 for item_id in ids):
+            save_ids(path, ids)
+        return ids
     except Exception as e:
         logger.error("Unexpected error while loading IDs from %s: %s", path, e)
         return set()
 
 
 def save_ids(path: Path, ids: Iterable[str]) -> None:
-    """Saves a set of IDs to a JSON file."""
+    """Saves a set of IDs to a file, one ID per line, replacing the file atomically."""
     path.parent.mkdir(parents=True, exist_ok=True)
     try:
-        with path.open("w", encoding="utf-8") as f:
-            # Ensure the IDs are sorted for consistent file content
-            sorted_ids: List[str] = sorted(list(set(ids)))
-            json.dump(sorted_ids, f, ensure_ascii=False, indent=2)
+        # Ensure the IDs are sorted for consistent file content
+        sorted_ids: List[str] = sorted(set(ids))
+        tmp_path = path.with_name(path.name + ".tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            f.writelines(f"{item_id}\n" for item_id in sorted_ids)
+            # Make the new content durable before it replaces the old file
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
         logger.info("Successfully saved %d IDs to %s.", len(sorted_ids), path)
     except IOError as e:
         logger.error("IO error while writing to %s: %s", path, e)
@@ -44,3 +77,25 @@ def save_ids(path: Path, ids: Iterable[str]) -> None:
         logger.error("Unexpected error while saving IDs to %s: %s", path, e)
 
 
+def append_ids(path: Path, new_ids: Iterable[str]) -> None:
+    """Appends IDs to the file, one per line, without rewriting the IDs already stored."""
+    ids: List[str] = list(new_ids)
+    if not ids:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        with path.open("a+b") as f:
+            data = "".join(f"{item_id}\n" for item_id in ids).encode("utf-8")
+            # Terminate a last line torn by an interrupted write so the first new ID is not glued onto it
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    data = b"\n" + data
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        logger.info("Successfully appended %d IDs to %s.", len(ids), path)
+    except IOError as e:
+        logger.error("IO error while appending to %s: %s", path, e)
+    except Exception as e:
+        logger.error("Unexpected error while appending IDs to %s: %s", path, e)
@@ -13,8 +13,8 @@ from src.core.gemini_client import ProcessedWord, ProcessedSentence
 
 @pytest.fixture
 def mock_requests(mocker):
-    """Fixture to mock requests.post."""
-    return mocker.patch("requests.post")
+    """Fixture to mock the pooled AnkiConnect session's post method."""
+    return mocker.patch.object(anki_client._session, "post")
 
 def test_format_word_note():
     """
@@ -108,11 +108,91 @@ def test_ensure_deck_and_model(mock_requests):
     mock_response.json.return_value = {"result": None, "error": None}
     mock_response.raise_for_status.return_value = None
     mock_requests.return_value = mock_response
+    anki_client.ensure_deck_and_model.cache_clear()
 
+    anki_client.ensure_deck_and_model("New Deck", "Some Model")
     anki_client.ensure_deck_and_model("New Deck", "Some Model")
 
-    mock_requests.assert_called_with(
+    # The second call is served from the cache without another request
+    mock_requests.assert_called_once_with(
         config.ANKICONNECT_URL,
         json={"action": "createDeck", "version": 6, "params": {"deck": "New Deck"}},
         timeout=30
     )
+
+def test_ensure_deck_and_model_cache_cleared_when_deck_missing(mock_requests):
+    """
+    Test that a 'deck was not found' error makes the next ensure_deck_and_model call recreate the deck.
+    """
+    ok_response = MagicMock()
+    ok_response.json.return_value = {"result": None, "error": None}
+    missing_response = MagicMock()
+    missing_response.json.return_value = {"result": None, "error": "deck was not found: New Deck"}
+    mock_requests.side_effect = [ok_response, missing_response, ok_response]
+    anki_client.ensure_deck_and_model.cache_clear()
+
+    anki_client.ensure_deck_and_model("New Deck", "Some Model")
+    assert anki_client.add_note({"deckName": "New Deck", "fields": {}}) is None
+    anki_client.ensure_deck_and_model("New Deck", "Some Model")
+
+    assert mock_requests.call_count == 3
+    assert mock_requests.call_args.kwargs["json"]["action"] == "createDeck"
+
+def test_add_notes_batches_into_single_request(mock_requests):
+    """
+    Test that add_notes sends all notes in one 'multi' request and returns the per-note IDs,
+    keeping the IDs of the notes that were added when another note in the batch fails.
+    """
+    mock_response = MagicMock()
+    mock_response.json.return_value = {
+        "result": [{"result": 1, "error": None}, {"result": None, "error": "cannot create note because it is a duplicate"}],
+        "error": None,
+    }
+    mock_response.raise_for_status.return_value = None
+    mock_requests.return_value = mock_response
+
+    notes = [{"deckName": "A", "fields": {}}, {"deckName": "B", "fields": {}}]
+    result = anki_client.add_notes(notes)
+
+    mock_requests.assert_called_once_with(
+        config.ANKICONNECT_URL,
+        json={
+            "action": "multi",
+            "version": 6,
+            "params": {"actions": [{"action": "addNote", "version": 6, "params": {"note": note}} for note in notes]},
+        },
+        timeout=30
+    )
+    assert result == [1, None]
+
+def test_add_notes_request_exception(mock_requests):
+    """
+    Test that add_notes reports every note as failed when the request itself fails.
+    """
+    mock_requests.side_effect = requests.exceptions.Timeout("Connection timed out")
+
+    result = anki_client.add_notes([{"fields": {}}, {"fields": {}}])
+
+    assert result == [None, None]
+
+def test_can_add_notes_single_request(mock_requests):
+    """
+    Test that can_add_notes validates every note in one 'canAddNotesWithErrorDetail' request.
+    """
+    mock_response = MagicMock()
+    mock_response.json.return_value = {
+        "result": [{"canAdd": True}, {"canAdd": False, "error": "cannot create note because it is empty"}],
+        "error": None,
+    }
+    mock_response.raise_for_status.return_value = None
+    mock_requests.return_value = mock_response
+
+    notes = [{"deckName": "A", "fields": {}}, {"deckName": "B", "fields": {}}]
+    result = anki_client.can_add_notes(notes)
+
+    mock_requests.assert_called_once_with(
+        config.ANKICONNECT_URL,
+        json={"action": "canAddNotesWithErrorDetail", "version": 6, "params": {"notes": notes}},
+        timeout=30
+    )
+    assert result == [True, False]
@@ -1,6 +1,8 @@
 import json
-from unittest.mock import MagicMock, patch
+import shelve
+from unittest.mock import ANY, MagicMock, patch
 import pytest
+from src.core.gemini_cache import GeminiCache
 from src.core.gemini_client import GeminiProcessor, ProcessedWord, ProcessedSentence, FavoriteItem
 
 @pytest.fixture
@@ -10,8 +12,9 @@ def mock_genai():
             yield mock_model
 
 @pytest.fixture
-def processor(mock_genai):
-    with patch("src.utils.config.GEMINI_API_KEY", "test_key"):
+def processor(mock_genai, tmp_path):
+    with patch("src.utils.config.GEMINI_API_KEY", "test_key"), \
+            patch("src.utils.config.GEMINI_CACHE_PATH", tmp_path / "gemini_cache"):
         return GeminiProcessor()
 
 def test_process_item_word(processor, mock_genai):
@@ -36,6 +39,15 @@ def test_process_item_word(processor, mock_genai):
     assert result.data.english_word == "test"
     assert result.data.japanese_meaning == "テスト"
 
+def test_process_item_sends_only_item_fields(processor, mock_genai):
+    mock_response = MagicMock()
+    mock_response.text = "this is not json"
+    processor.model.generate_content.return_value = mock_response
+
+    processor.process_item(FavoriteItem(text="test", translation="テスト", item_id="123"))
+
+    processor.model.generate_content.assert_called_once_with("- **Text:** test\n- **Translated Text:** テスト")
+
 def test_process_item_sentence(processor, mock_genai):
     # Mock response for a sentence
     mock_response = MagicMock()
@@ -89,3 +101,100 @@ Markdown suffix"""
     
     assert result is not None
     assert result.type == "word"
+
+def test_process_items_preserves_order_and_failures(processor, mock_genai):
+    word_response = MagicMock()
+    word_response.text = json.dumps({
+        "type": "word",
+        "data": {
+            "english_word": "test",
+            "example_sentence": "This is a test.",
+            "japanese_meaning": "テスト",
+            "example_translation": "これはテストです。"
+        }
+    })
+    bad_response = MagicMock()
+    bad_response.text = "this is not json"
+    # Worker threads may call the model in any order, so answer by prompt
+    processor.model.generate_content.side_effect = lambda prompt: bad_response if "broken" in prompt else word_response
+
+    items = [
+        FavoriteItem(text="test", translation="テスト", item_id="1"),
+        FavoriteItem(text="broken", translation="壊れた", item_id="2"),
+    ]
+    results = processor.process_items(items)
+
+    assert len(results) == 2
+    assert results[0].item_id == "1"
+    assert results[1] is None
+
+def test_process_item_uses_cache_for_identical_input(processor, mock_genai):
+    mock_response = MagicMock()
+    mock_response.text = json.dumps({
+        "type": "sentence",
+        "data": {
+            "english_sentence": "I go to school.",
+            "japanese_sentence": "学校へ行きます。"
+        }
+    })
+    processor.model.generate_content.return_value = mock_response
+
+    first = processor.process_item(FavoriteItem(text="I go to school.", translation="学校へ行きます。", item_id="1"))
+    second = processor.process_item(FavoriteItem(text="I go to school.", translation="学校へ行きます。", item_id="2"))
+
+    processor.model.generate_content.assert_called_once()
+    assert second.item_id == "2"
+    assert second.data == first.data
+
+def test_process_items_cache_hits_do_not_spend_rate_limit(processor, mock_genai):
+    mock_response = MagicMock()
+    mock_response.text = json.dumps({
+        "type": "sentence",
+        "data": {
+            "english_sentence": "I go to school.",
+            "japanese_sentence": "学校へ行きます。"
+        }
+    })
+    processor.model.generate_content.return_value = mock_response
+    items = [FavoriteItem(text="I go to school.", translation="学校へ行きます。", item_id=str(i)) for i in range(3)]
+    processor.process_item(items[0])
+
+    with patch("src.utils.config.GEMINI_RPM", 1), \
+            patch("src.core.gemini_client._RateLimiter.acquire") as mock_acquire:
+        results = processor.process_items(items)
+
+    assert [r.item_id for r in results] == ["0", "1", "2"]
+    mock_acquire.assert_not_called()
+    processor.model.generate_content.assert_called_once()
+
+def test_gemini_cache_keeps_shelf_open_until_closed(tmp_path):
+    cache = GeminiCache(tmp_path / "gemini_cache")
+    with patch("src.core.gemini_cache.shelve.open", wraps=shelve.open) as mock_open:
+        cache.set("key", {"type": "word"})
+        assert cache.get("key") == {"type": "word"}
+        assert cache.get("missing") is None
+    mock_open.assert_called_once()
+
+    cache.close()
+    assert GeminiCache(tmp_path / "gemini_cache").get("key") == {"type": "word"}
+
+def test_context_cache_used_when_enabled(mock_genai, tmp_path):
+    cached_content = MagicMock()
+    with patch("src.utils.config.GEMINI_API_KEY", "test_key"), \
+            patch("src.utils.config.GEMINI_CACHE_PATH", tmp_path / "gemini_cache"), \
+            patch("src.utils.config.GEMINI_CONTEXT_CACHE_TTL", 3600), \
+            patch("src.core.gemini_client.caching.CachedContent.create", return_value=cached_content) as mock_create:
+        processor = GeminiProcessor()
+
+    mock_create.assert_called_once()
+    mock_genai.from_cached_content.assert_called_once_with(cached_content, generation_config=ANY)
+    assert processor.model is mock_genai.from_cached_content.return_value
+
+def test_process_item_unknown_type(processor, mock_genai):
+    mock_response = MagicMock()
+    mock_response.text = json.dumps({"type": "idiom", "data": {"english_word": "test"}})
+    processor.model.generate_content.return_value = mock_response
+
+    result = processor.process_item(FavoriteItem(text="test", translation="テスト", item_id="123"))
+
+    assert result is None
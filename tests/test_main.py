@@ -1,5 +1,6 @@
+import threading
 import pytest
-from unittest.mock import MagicMock, patch, call
+from unittest.mock import ANY, MagicMock, patch, call
 
 # src ディレクトリをパスに追加
 import sys
@@ -7,7 +8,8 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 from src.main import run_once
-from src.core.scraper import FavoriteItem
+from src.core.scraper import FavoriteItem, legacy_item_id
+from src.core import anki_client
 from src.core.gemini_client import ProcessedItem, ProcessedWord
 
 @pytest.fixture
@@ -15,19 +17,24 @@ def mock_dependencies(mocker):
     """Fixture to mock all external dependencies for main.py."""
     mocks = {
         'load_ids': mocker.patch('src.main.load_ids'),
-        'save_ids': mocker.patch('src.main.save_ids'),
+        'append_ids': mocker.patch('src.main.append_ids'),
         'fetch_favorites': mocker.patch('src.main.fetch_favorites'),
-        'delete_favorite_item': mocker.patch('src.main.delete_favorite_item'),
-        'GeminiProcessor': mocker.patch('src.main.GeminiProcessor'),
-        'add_note': mocker.patch('src.main.add_note'),
+        'browser_session': mocker.patch('src.main.browser_session'),
+        'delete_favorite_items': mocker.patch('src.main.delete_favorite_items'),
+        'get_gemini_processor': mocker.patch('src.main.get_gemini_processor'),
+        'add_notes': mocker.patch('src.main.add_notes'),
+        'can_add_notes': mocker.patch('src.main.can_add_notes', side_effect=lambda notes: [True] * len(notes)),
         'ensure_deck_and_model': mocker.patch('src.main.ensure_deck_and_model'),
         'format_word_note': mocker.patch('src.main.format_word_note'),
     }
 
-    # Mock the return value for the GeminiProcessor instance's method
-    mock_gemini_instance = mocks['GeminiProcessor'].return_value
+    # Mock the return value for the shared GeminiProcessor instance's method
+    mock_gemini_instance = mocks['get_gemini_processor'].return_value
     mock_gemini_instance.process_item = MagicMock()
     mocks['process_item'] = mock_gemini_instance.process_item
+    mock_gemini_instance.process_items.side_effect = lambda items: [
+        mock_gemini_instance.process_item(item) for item in items
+    ]
 
     return mocks
 
@@ -42,8 +49,8 @@ def test_run_once_happy_path(mock_dependencies, mocker): # Added mocker fixture
     mock_dependencies['process_item'].return_value = processed_item
 
     mock_dependencies['format_word_note'].return_value = {"fields": {}}
-    mock_dependencies['add_note'].return_value = 12345 # Success
-    mock_dependencies['delete_favorite_item'].return_value = True
+    mock_dependencies['add_notes'].return_value = [12345] # Success
+    mock_dependencies['delete_favorite_items'].side_effect = lambda items: {i.item_id: True for i in items}
 
     # Act
     run_once(limit=10, dry_run=False, skip_browser=False)
@@ -52,13 +59,102 @@ def test_run_once_happy_path(mock_dependencies, mocker): # Added mocker fixture
     mock_dependencies['load_ids'].assert_called_once()
     mock_dependencies['fetch_favorites'].assert_called_once()
     mock_dependencies['process_item'].assert_called_once_with(new_items[0])
-    mock_dependencies['add_note'].assert_called_once()
-    mock_dependencies['save_ids'].assert_called_once_with(mocker.ANY, {'1'})
-    mock_dependencies['delete_favorite_item'].assert_called_once_with(new_items[0])
+    mock_dependencies['add_notes'].assert_called_once_with([{"fields": {}}])
+    mock_dependencies['append_ids'].assert_called_once_with(mocker.ANY, ['1'])
+    mock_dependencies['delete_favorite_items'].assert_called_once_with([new_items[0]])
 
-def test_run_once_dry_run(mock_dependencies):
+def test_run_once_skips_notes_anki_cannot_add(mock_dependencies):
+    """Test that notes rejected by canAddNotes are neither submitted nor marked as processed."""
+    # Arrange
+    mock_dependencies['load_ids'].return_value = set()
+    new_items = [
+        FavoriteItem(text='good', translation='良い', item_id='1'),
+        FavoriteItem(text='bad', translation='悪い', item_id='2'),
+    ]
+    mock_dependencies['fetch_favorites'].return_value = new_items
+    mock_dependencies['process_item'].side_effect = lambda item: ProcessedItem(
+        item_id=item.item_id, type='word', data=ProcessedWord(item.text, 'ex', item.translation, 'ex_trans')
+    )
+    mock_dependencies['format_word_note'].side_effect = lambda data: {"fields": {"単語": data.english_word}}
+    mock_dependencies['can_add_notes'].side_effect = None
+    mock_dependencies['can_add_notes'].return_value = [True, False]
+    mock_dependencies['add_notes'].return_value = [12345]
+    mock_dependencies['delete_favorite_items'].side_effect = lambda items: {i.item_id: True for i in items}
+
+    # Act
+    run_once(limit=10, dry_run=False, skip_browser=False)
+
+    # Assert
+    mock_dependencies['add_notes'].assert_called_once_with([{"fields": {"単語": "good"}}])
+    mock_dependencies['append_ids'].assert_called_once_with(ANY, ['1'])
+    mock_dependencies['delete_favorite_items'].assert_called_once_with([new_items[0]])
+
+def test_run_once_records_only_notes_added_by_batch(mock_dependencies):
+    """Test that a partially failed addNotes batch only marks and deletes the items whose notes were added."""
+    # Arrange
+    mock_dependencies['load_ids'].return_value = set()
+    new_items = [
+        FavoriteItem(text='added', translation='追加', item_id='1'),
+        FavoriteItem(text='failed', translation='失敗', item_id='2'),
+    ]
+    mock_dependencies['fetch_favorites'].return_value = new_items
+    mock_dependencies['process_item'].side_effect = lambda item: ProcessedItem(
+        item_id=item.item_id, type='word', data=ProcessedWord(item.text, 'ex', item.translation, 'ex_trans')
+    )
+    mock_dependencies['format_word_note'].side_effect = lambda data: {"fields": {"単語": data.english_word}}
+    mock_dependencies['add_notes'].return_value = [12345, None]
+    mock_dependencies['delete_favorite_items'].side_effect = lambda items: {i.item_id: True for i in items}
+
+    # Act
+    run_once(limit=10, dry_run=False, skip_browser=False)
+
+    # Assert
+    mock_dependencies['add_notes'].assert_called_once_with(
+        [{"fields": {"単語": "added"}}, {"fields": {"単語": "failed"}}]
+    )
+    mock_dependencies['append_ids'].assert_called_once_with(ANY, ['1'])
+    mock_dependencies['delete_favorite_items'].assert_called_once_with([new_items[0]])
+
+def test_run_once_recreates_deck_reported_missing_by_can_add_notes(mock_dependencies, mocker):
+    """Test that a deck deleted during the process is created again on the next run."""
+    # Arrange
+    mocker.patch('src.main.ensure_deck_and_model', anki_client.ensure_deck_and_model)
+    mocker.patch('src.main.can_add_notes', anki_client.can_add_notes)
+    anki_client.ensure_deck_and_model.cache_clear()
+    can_add_results = iter([
+        [{"canAdd": False, "error": "deck was not found: Default"}],
+        [{"canAdd": True}],
+    ])
+    invoke = mocker.patch(
+        'src.core.anki_client._invoke',
+        side_effect=lambda action, params=None: next(can_add_results) if action == "canAddNotesWithErrorDetail" else None,
+    )
+    mock_dependencies['load_ids'].return_value = set()
+    mock_dependencies['fetch_favorites'].return_value = [FavoriteItem(text='new', translation='新しい', item_id='1')]
+    mock_dependencies['process_item'].return_value = ProcessedItem(
+        item_id='1', type='word', data=ProcessedWord('new', 'ex', '新しい', 'ex_trans')
+    )
+    mock_dependencies['format_word_note'].return_value = {"deckName": "Default", "fields": {}}
+    mock_dependencies['add_notes'].return_value = [12345]
+    mock_dependencies['delete_favorite_items'].side_effect = lambda items: {i.item_id: True for i in items}
+
+    def create_deck_calls():
+        return sum(1 for c in invoke.call_args_list if c.args[0] == "createDeck")
+
+    # Act
+    run_once(limit=10, dry_run=False, skip_browser=False)
+    first_run_creates = create_deck_calls()
+    run_once(limit=10, dry_run=False, skip_browser=False)
+
+    # Assert
+    assert first_run_creates > 0
+    assert create_deck_calls() == 2 * first_run_creates
+    mock_dependencies['add_notes'].assert_called_with([{"deckName": "Default", "fields": {}}])
+
+def test_run_once_dry_run(mock_dependencies, caplog):
     """Test that a dry run fetches and processes but does not save or delete."""
     # Arrange
+    caplog.set_level("INFO", logger="main")
     mock_dependencies['load_ids'].return_value = set()
     new_items = [FavoriteItem(text='new', translation='新しい', item_id='1')]
     mock_dependencies['fetch_favorites'].return_value = new_items
@@ -75,10 +171,29 @@ def test_run_once_dry_run(mock_dependencies):
     mock_dependencies['fetch_favorites'].assert_called_once()
     mock_dependencies['process_item'].assert_called_once()
 
+    assert 'DRY RUN - Anki Notes: [{"deck":null,"model":null,"fields":{}}]' in caplog.text
+
     # These should NOT be called in a dry run
-    mock_dependencies['add_note'].assert_not_called()
-    mock_dependencies['save_ids'].assert_not_called()
-    mock_dependencies['delete_favorite_item'].assert_not_called()
+    mock_dependencies['add_notes'].assert_not_called()
+    mock_dependencies['append_ids'].assert_not_called()
+    mock_dependencies['delete_favorite_items'].assert_not_called()
+
+def test_run_once_dry_run_only_processes_up_to_limit(mock_dependencies):
+    """Test that a dry run only sends the first `limit` new items to Gemini."""
+    # Arrange
+    mock_dependencies['load_ids'].return_value = set()
+    new_items = [
+        FavoriteItem(text='one', translation='一', item_id='1'),
+        FavoriteItem(text='two', translation='二', item_id='2'),
+    ]
+    mock_dependencies['fetch_favorites'].return_value = new_items
+    mock_dependencies['process_item'].return_value = None
+
+    # Act
+    run_once(limit=1, dry_run=True, skip_browser=False)
+
+    # Assert
+    mock_dependencies['process_item'].assert_called_once_with(new_items[0])
 
 def test_run_once_cleans_up_stale_items(mock_dependencies):
     """Test that stale items (processed but not deleted) are cleaned up."""
@@ -88,7 +203,7 @@ def test_run_once_cleans_up_stale_items(mock_dependencies):
 
     # fetch_favorites is called once, finds a stale item.
     mock_dependencies['fetch_favorites'].return_value = [stale_item]
-    mock_dependencies['delete_favorite_item'].return_value = True
+    mock_dependencies['delete_favorite_items'].side_effect = lambda items: {i.item_id: True for i in items}
 
     # Act
     run_once(limit=10, dry_run=False, skip_browser=False)
@@ -99,13 +214,115 @@ def test_run_once_cleans_up_stale_items(mock_dependencies):
     # It should fetch once, find stale item, delete it
     mock_dependencies['fetch_favorites'].assert_called_once_with(limit=10)
 
-    mock_dependencies['delete_favorite_item'].assert_called_once_with(stale_item)
+    mock_dependencies['delete_favorite_items'].assert_called_once_with([stale_item])
 
     # Since there are no new items after cleanup, processing should not occur
+    mock_dependencies['get_gemini_processor'].assert_not_called()
+    mock_dependencies['process_item'].assert_not_called()
+    mock_dependencies['add_notes'].assert_not_called()
+    # append_ids is only called when new items are successfully added to Anki
+    mock_dependencies['append_ids'].assert_not_called()
+
+def test_run_once_stale_and_new_items_use_single_fetch(mock_dependencies):
+    """Test that cleaning up stale items does not trigger a second scrape before processing new ones."""
+    # Arrange
+    mock_dependencies['load_ids'].return_value = {'1'}
+    stale_item = FavoriteItem(text='stale', translation='古い', item_id='1')
+    new_item = FavoriteItem(text='new', translation='新しい', item_id='2')
+    mock_dependencies['fetch_favorites'].return_value = [stale_item, new_item]
+    mock_dependencies['delete_favorite_items'].side_effect = lambda items: {i.item_id: True for i in items}
+
+    processed_item = ProcessedItem(item_id='2', type='word', data=ProcessedWord('new', 'ex', '新しい', 'ex_trans'))
+    mock_dependencies['process_item'].return_value = processed_item
+    mock_dependencies['format_word_note'].return_value = {"fields": {}}
+    mock_dependencies['add_notes'].return_value = [12345]
+
+    # Act
+    run_once(limit=10, dry_run=False, skip_browser=False)
+
+    # Assert
+    mock_dependencies['fetch_favorites'].assert_called_once_with(limit=10)
+    mock_dependencies['process_item'].assert_called_once_with(new_item)
+    mock_dependencies['delete_favorite_items'].assert_has_calls([call([stale_item]), call([new_item])])
+
+def test_run_once_processes_new_items_while_deleting_stale_ones(mock_dependencies):
+    """Test that Gemini processing of new items overlaps the browser cleanup of stale items."""
+    # Arrange
+    mock_dependencies['load_ids'].return_value = {'1'}
+    stale_item = FavoriteItem(text='stale', translation='古い', item_id='1')
+    new_item = FavoriteItem(text='new', translation='新しい', item_id='2')
+    mock_dependencies['fetch_favorites'].return_value = [stale_item, new_item]
+    processing_started = threading.Event()
+    mock_dependencies['process_item'].side_effect = lambda item: processing_started.set()
+
+    def delete_stale(items):
+        # Only returns once processing is running in the background
+        assert processing_started.wait(timeout=5)
+        return {i.item_id: True for i in items}
+    mock_dependencies['delete_favorite_items'].side_effect = delete_stale
+
+    # Act
+    run_once(limit=10, dry_run=False, skip_browser=False)
+
+    # Assert
+    mock_dependencies['delete_favorite_items'].assert_called_once_with([stale_item])
+    mock_dependencies['process_item'].assert_called_once_with(new_item)
+
+def test_run_once_processes_duplicate_favorites_once(mock_dependencies):
+    """Test that favorites saved twice with the same text and translation yield a single note."""
+    # Arrange
+    mock_dependencies['load_ids'].return_value = set()
+    first = FavoriteItem(text='new', translation='新しい', item_id='1')
+    mock_dependencies['fetch_favorites'].return_value = [first, FavoriteItem(text='new', translation='新しい', item_id='1')]
+    mock_dependencies['process_item'].return_value = None
+
+    # Act
+    run_once(limit=10, dry_run=True, skip_browser=False)
+
+    # Assert
+    mock_dependencies['process_item'].assert_called_once_with(first)
+
+def test_run_once_shifts_dom_indices_past_deleted_stale_items(mock_dependencies):
+    """Test that new items are deleted at their positions after the stale cleanup, without a second fetch."""
+    # Arrange
+    mock_dependencies['load_ids'].return_value = {'s1', 's2'}
+    favorites = [
+        FavoriteItem(text='stale', translation='古い', item_id='s1', dom_index=0),
+        FavoriteItem(text='new', translation='新しい', item_id='n1', dom_index=1),
+        FavoriteItem(text='stuck', translation='残る', item_id='s2', dom_index=2),
+        FavoriteItem(text='newer', translation='もっと新しい', item_id='n2', dom_index=3),
+    ]
+    mock_dependencies['fetch_favorites'].return_value = favorites
+    mock_dependencies['process_item'].side_effect = lambda item: ProcessedItem(
+        item_id=item.item_id, type='word', data=ProcessedWord(item.text, 'ex', item.translation, 'ex_trans')
+    )
+    mock_dependencies['format_word_note'].return_value = {"fields": {}}
+    mock_dependencies['add_notes'].side_effect = lambda notes: list(range(len(notes)))
+    # The second stale item fails to delete and stays on the page
+    mock_dependencies['delete_favorite_items'].side_effect = lambda items: {i.item_id: i.item_id != 's2' for i in items}
+
+    # Act
+    run_once(limit=10, dry_run=False, skip_browser=False)
+
+    # Assert
+    mock_dependencies['fetch_favorites'].assert_called_once()
+    deleted_new = mock_dependencies['delete_favorite_items'].call_args.args[0]
+    assert [(i.item_id, i.dom_index) for i in deleted_new] == [('n1', 0), ('n2', 2)]
+
+def test_run_once_treats_legacy_sha256_ids_as_processed(mock_dependencies):
+    """Test that items recorded under the old sha256 ID scheme are cleaned up rather than reprocessed."""
+    # Arrange
+    stale_item = FavoriteItem(text='stale', translation='古い', item_id='new-style-id')
+    mock_dependencies['load_ids'].return_value = {legacy_item_id(stale_item)}
+    mock_dependencies['fetch_favorites'].return_value = [stale_item]
+    mock_dependencies['delete_favorite_items'].side_effect = lambda items: {i.item_id: True for i in items}
+
+    # Act
+    run_once(limit=10, dry_run=False, skip_browser=False)
+
+    # Assert
+    mock_dependencies['delete_favorite_items'].assert_called_once_with([stale_item])
     mock_dependencies['process_item'].assert_not_called()
-    mock_dependencies['add_note'].assert_not_called()
-    # save_ids is only called when new items are successfully added to Anki
-    mock_dependencies['save_ids'].assert_not_called()
 
 def test_run_once_skip_browser(mock_dependencies):
     """Test that browser operations are skipped with the --skip-browser flag."""
@@ -120,9 +337,9 @@ def test_run_once_skip_browser(mock_dependencies):
 
     # Browser operations should be skipped
     mock_dependencies['fetch_favorites'].assert_not_called()
-    mock_dependencies['delete_favorite_item'].assert_not_called()
+    mock_dependencies['delete_favorite_items'].assert_not_called()
 
     # Since no items are fetched, nothing else should happen
     mock_dependencies['process_item'].assert_not_called()
-    mock_dependencies['add_note'].assert_not_called()
-    mock_dependencies['save_ids'].assert_not_called()
+    mock_dependencies['add_notes'].assert_not_called()
+    mock_dependencies['append_ids'].assert_not_called()
@@ -0,0 +1,122 @@
+from unittest.mock import ANY, MagicMock, patch
+import pytest
+from src.core.scraper import Scraper, FavoriteItem
+
+@pytest.fixture
+def mock_playwright():
+    with patch("src.core.scraper.sync_playwright") as mock_sync_playwright:
+        yield mock_sync_playwright
+
+@pytest.fixture
+def page(mock_playwright):
+    """The page a Scraper call gets when it runs outside a session."""
+    return mock_playwright.return_value.__enter__.return_value.chromium.launch.return_value.new_context.return_value.new_page.return_value
+
+def test_session_reuses_one_browser(mock_playwright):
+    pw = mock_playwright.return_value.start.return_value
+    item = FavoriteItem(text="test", translation="テスト", item_id="1")
+
+    with Scraper() as scraper:
+        scraper.delete_favorite_items([item])
+        scraper.delete_favorite_items([item])
+
+    mock_playwright.return_value.start.assert_called_once()
+    pw.chromium.launch.assert_called_once()
+    pw.chromium.launch.return_value.close.assert_called_once()
+    pw.stop.assert_called_once()
+
+def test_session_without_calls_never_launches(mock_playwright):
+    with Scraper():
+        pass
+
+    mock_playwright.assert_not_called()
+
+def test_calls_outside_session_use_their_own_browser(mock_playwright):
+    pw = mock_playwright.return_value.__enter__.return_value
+    item = FavoriteItem(text="test", translation="テスト", item_id="1")
+
+    scraper = Scraper()
+    scraper.delete_favorite_items([item])
+    scraper.delete_favorite_items([item])
+
+    assert pw.chromium.launch.call_count == 2
+
+def test_delete_favorite_items_reports_each_item(page):
+    found, missing = MagicMock(), MagicMock()
+    found.count.return_value = 1
+    missing.count.return_value = 0
+    page.locator.side_effect = lambda selector: MagicMock(first=missing if "gone" in selector else found)
+
+    items = [
+        FavoriteItem(text="here", translation="ここ", item_id="1"),
+        FavoriteItem(text="gone", translation="消えた", item_id="2"),
+    ]
+    results = Scraper().delete_favorite_items(items)
+
+    assert results == {"1": True, "2": False}
+    page.goto.assert_called_once()
+
+def test_delete_favorite_items_uses_dom_index_bottom_up(page):
+    rows = page.locator.return_value.nth
+    rows.side_effect = lambda i: MagicMock(**{"locator.return_value.first.inner_text.return_value": ["a", "b", "c"][i]})
+
+    items = [
+        FavoriteItem(text="a", translation="あ", item_id="1", dom_index=0),
+        FavoriteItem(text="c", translation="し", item_id="3", dom_index=2),
+    ]
+    results = Scraper().delete_favorite_items(items)
+
+    assert results == {"1": True, "3": True}
+    assert [c.args[0] for c in rows.call_args_list] == [2, 0]
+    assert not any(":has-text" in c.args[0] for c in page.locator.call_args_list)
+
+def test_fetch_favorites_extracts_in_one_evaluate(page):
+    page.locator.return_value.count.return_value = 0
+    rows = [
+        {"text": "one", "translation": "一"},
+        {"text": "", "translation": "空"},
+        {"text": "two", "translation": "二"},
+        {"text": "three", "translation": "三"},
+    ]
+    # The page script only reads the first `limit` rows
+    page.evaluate.side_effect = lambda script, sel: rows[:sel["limit"]]
+
+    items = Scraper().fetch_favorites(limit=3)
+
+    page.evaluate.assert_called_once()
+    assert page.evaluate.call_args.args[1]["limit"] == 3
+    assert [(i.text, i.translation) for i in items] == [("one", "一"), ("two", "二")]
+    assert [i.dom_index for i in items] == [0, 2]
+
+def test_compute_item_id_is_short_and_unambiguous():
+    item_id = Scraper._compute_item_id("a-b", "c")
+
+    assert len(item_id) == 32
+    assert item_id != Scraper._compute_item_id("a", "b-c")
+
+def test_new_context_blocks_assets_except_for_manual_login():
+    scraper = Scraper()
+
+    context, _ = scraper._new_context(MagicMock(), manual_login=False)
+    context.route.assert_called_once()
+
+    context, _ = scraper._new_context(MagicMock(), manual_login=True)
+    context.route.assert_not_called()
+
+@pytest.fixture
+def failing_page(page):
+    """A page whose navigation fails, sending fetch_favorites down its error path."""
+    page.goto.side_effect = RuntimeError("navigation failed")
+    return page
+
+def test_fetch_favorites_survives_failed_error_screenshot(failing_page):
+    failing_page.screenshot.side_effect = RuntimeError("screenshot timed out")
+
+    assert Scraper().fetch_favorites() == []
+    failing_page.screenshot.assert_called_once_with(path=ANY, timeout=2000)
+
+def test_error_screenshot_can_be_disabled(failing_page):
+    with patch("src.utils.config.CAPTURE_ERROR_SCREENSHOTS", False):
+        assert Scraper().fetch_favorites() == []
+
+    failing_page.screenshot.assert_not_called()
@@ -1,7 +1,7 @@
 import json
 from pathlib import Path
 import pytest
-from src.utils.storage import load_ids, save_ids
+from src.utils.storage import append_ids, load_ids, save_ids
 
 def test_save_and_load_ids(tmp_path):
     test_file = tmp_path / "test_ids.json"
@@ -20,10 +20,22 @@ def test_load_ids_file_not_found(tmp_path):
 
 def test_load_ids_invalid_json(tmp_path):
     test_file = tmp_path / "invalid.json"
-    test_file.write_text("invalid json")
+    test_file.write_text("[invalid json")
     
     loaded_ids = load_ids(test_file)
     assert loaded_ids == set()
+    # The unreadable file is moved aside so that later appends start a clean log
+    assert not test_file.exists()
+    assert (tmp_path / "invalid.json.corrupt").read_text() == "[invalid json"
+
+def test_load_ids_empty_legacy_list_then_append(tmp_path):
+    test_file = tmp_path / "processed_ids.json"
+    test_file.write_text("[]")
+
+    assert load_ids(test_file) == set()
+    append_ids(test_file, ["abc", "def"])
+
+    assert load_ids(test_file) == {"abc", "def"}
 
 def test_load_ids_not_a_list(tmp_path):
     test_file = tmp_path / "not_list.json"
@@ -31,6 +43,56 @@ def test_load_ids_not_a_list(tmp_path):
     
     loaded_ids = load_ids(test_file)
     assert loaded_ids == set()
+    assert test_file.read_text(encoding="utf-8") == ""
+
+def test_save_ids_writes_one_id_per_line(tmp_path):
+    test_file = tmp_path / "test_ids.json"
+
+    save_ids(test_file, ["id2", "id1", "id2"])
+
+    assert test_file.read_text(encoding="utf-8") == "id1\nid2\n"
+
+def test_save_ids_rewrites_after_append(tmp_path):
+    test_file = tmp_path / "test_ids.json"
+    save_ids(test_file, {"id1"})
+    append_ids(test_file, ["id1"])
+
+    save_ids(test_file, {"id1"})
+
+    assert test_file.read_text(encoding="utf-8") == "id1\n"
+
+def test_load_ids_legacy_json_list(tmp_path):
+    test_file = tmp_path / "legacy.json"
+    test_file.write_text(json.dumps(["id1", "id2"], indent=2))
+
+    loaded_ids = load_ids(test_file)
+    assert loaded_ids == {"id1", "id2"}
+    # The legacy file is migrated to the line format on load
+    assert test_file.read_text(encoding="utf-8") == "id1\nid2\n"
+
+def test_append_ids_adds_to_existing_file(tmp_path):
+    test_file = tmp_path / "test_ids.json"
+    save_ids(test_file, {"id1"})
+
+    append_ids(test_file, ["id2", "id3"])
+
+    assert test_file.read_text(encoding="utf-8") == "id1\nid2\nid3\n"
+    assert load_ids(test_file) == {"id1", "id2", "id3"}
+
+def test_append_ids_after_torn_last_line(tmp_path):
+    test_file = tmp_path / "test_ids.json"
+    test_file.write_text("id1\nid", encoding="utf-8")
+
+    append_ids(test_file, ["id2"])
+
+    assert load_ids(test_file) == {"id1", "id", "id2"}
+
+def test_load_ids_compacts_duplicated_log(tmp_path):
+    test_file = tmp_path / "test_ids.json"
+    test_file.write_text("id1\nid1\nid1\nid1\nid2\n", encoding="utf-8")
+
+    assert load_ids(test_file) == {"id1", "id2"}
+    assert test_file.read_text(encoding="utf-8") == "id1\nid2\n"
 
 def test_save_ids_creates_directory(tmp_path):
     test_dir = tmp_path / "subdir"